@@ -0,0 +1,231 @@
+"""
+    Microbenchmarks for the hot paths of gaelib.db. They run against
+    the in-memory datastore backend by default, or against the
+    emulator when --backend cloud is given and DATASTORE_EMULATOR_HOST
+    is set. Run from the repo root with
+
+        python -m benchmarks.db_benchmarks --output results.json
+
+    Every benchmark reports operations per second and the p50 and p99
+    latency of one operation in microseconds. Fast operations are
+    timed in batches, so their percentiles are over batch averages.
+"""
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+BENCHMARK_NAMESPACE = 'gaelib-benchmarks'
+
+
+def percentile(samples, percent):
+  """
+      Returns the nearest rank percentile of samples.
+  """
+  ordered = sorted(samples)
+  rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+  return ordered[rank - 1]
+
+
+def measure(name, fn, number=1, repeat=20, items=1, setup=None):
+  """
+      Calls fn number times per sample, repeat times after a warmup
+      sample, and returns the result as a dict. setup, if given, runs
+      before every sample outside of the timing and fn is called with
+      what it returns. items is how many rows one call handles, for
+      the throughput of bulk operations.
+  """
+  samples = []
+  for sample in range(repeat + 1):
+    args = () if setup is None else (setup(),)
+    # Like timeit, keep collector pauses out of the samples
+    gc.collect()
+    gc.disable()
+    try:
+      start = time.perf_counter()
+      for _ in range(number):
+        fn(*args)
+      elapsed = time.perf_counter() - start
+    finally:
+      gc.enable()
+    if sample:
+      samples.append(elapsed / number)
+
+  mean = sum(samples) / len(samples)
+  return {
+      'name': name,
+      'ops_per_sec': 1 / mean if mean else None,
+      'items_per_sec': items / mean if mean else None,
+      'items_per_op': items,
+      'p50_us': percentile(samples, 50) * 1e6,
+      'p99_us': percentile(samples, 99) * 1e6,
+      'samples': len(samples),
+      'batch': number,
+  }
+
+
+def clear_kind(client, kind):
+  query = client.query(kind=kind)
+  query.keys_only()
+  keys = [entity.key for entity in query.fetch()]
+  for index in range(0, len(keys), 500):
+    client.delete_multi(keys[index:index + 500])
+
+
+def make_models(model_class, count, key_prefix=None):
+  """
+      Returns count unsaved models, named key_prefix followed by their
+      index when key_prefix is given and with numeric ids otherwise.
+  """
+  models = []
+  for index in range(count):
+    kwargs = {}
+    if key_prefix is not None:
+      kwargs['key_str'] = '{}{}'.format(key_prefix, index)
+    models.append(model_class(string1='string {}'.format(index),
+                              string2=random.choice(['a', 'b', 'c']),
+                              int1=index, float1=index / 2.0,
+                              bool1=index % 2 == 0, **kwargs))
+  return models
+
+
+def store_models(model_class, count, key_prefix=None):
+  models = make_models(model_class, count, key_prefix)
+  for result in model_class.put_multi(models, parallel=True):
+    if not result.ok:
+      raise result.error
+  return models
+
+
+def run(sizes, repeat):
+  # Imported here so the backend and namespace are picked first
+  from gaelib.db import clients, constants, model, properties
+
+  class BenchmarkModel(model.Model):
+    """
+        The model every benchmark works with
+    """
+    string1 = properties.StringProperty()
+    string2 = properties.StringProperty(choices=['a', 'b', 'c'])
+    int1 = properties.IntegerProperty()
+    float1 = properties.FloatProperty()
+    bool1 = properties.BooleanProperty()
+
+  kind = BenchmarkModel.__name__
+  client = clients.get_client()
+  clear_kind(client, kind)
+  results = []
+
+  results.append(measure(
+      'model_init', lambda: BenchmarkModel(string1='value', int1=1),
+      number=1000, repeat=repeat))
+
+  stored = store_models(BenchmarkModel, 100)
+  keys = [stored_model.key() for stored_model in stored]
+  results.append(measure(
+      'model_init_with_key',
+      lambda: BenchmarkModel(key=random.choice(keys)),
+      number=100, repeat=repeat))
+
+  instance = stored[0]
+  results.append(measure(
+      'attribute_read', lambda: instance.string1, number=10000,
+      repeat=repeat))
+
+  string_property = BenchmarkModel.__dict__['string1']
+  choices_property = BenchmarkModel.__dict__['string2']
+  results.append(measure(
+      'property_validate', lambda: string_property.validate('value'),
+      number=10000, repeat=repeat))
+  results.append(measure(
+      'property_validate_choices', lambda: choices_property.validate('b'),
+      number=10000, repeat=repeat))
+
+  for size in (100, constants.MAX_KEYS_PER_LOOKUP):
+    # key_strs are key names, like the key_str the models are saved with
+    key_strs = [stored_model.key().name for stored_model in store_models(
+        BenchmarkModel, size, key_prefix='retrieve-{}-'.format(size))]
+    random.shuffle(key_strs)
+    if None in BenchmarkModel.retrieve(key_strs=key_strs):
+      raise RuntimeError('retrieve benchmark models were not found')
+    results.append(measure(
+        'retrieve_key_strs_{}'.format(size),
+        lambda: BenchmarkModel.retrieve(key_strs=key_strs),
+        repeat=repeat, items=size))
+  clear_kind(client, kind)
+
+  batch_size = constants.MAX_MUTATIONS_PER_COMMIT
+  results.append(measure(
+      'put_multi_{}'.format(batch_size), BenchmarkModel.put_multi,
+      repeat=repeat, items=batch_size,
+      setup=lambda: make_models(BenchmarkModel, batch_size)))
+  clear_kind(client, kind)
+
+  for size in sizes:
+    store_models(BenchmarkModel, size)
+    # Fewer samples for the large result sets keep the run short
+    size_repeat = max(3, min(repeat, repeat * 1000 // size))
+    query = BenchmarkModel.query()
+    results.append(measure(
+        'query_fetch_{}'.format(size), lambda: query.fetch(),
+        repeat=size_repeat, items=size))
+    entities = list(client.query(kind=kind).fetch())
+    results.append(measure(
+        'hydrate_{}'.format(size),
+        lambda: BenchmarkModel.from_entities(entities),
+        repeat=size_repeat, items=size))
+    clear_kind(client, kind)
+
+  return results
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split('.')[0])
+  parser.add_argument('--backend', choices=['memory', 'cloud'],
+                      default='memory',
+                      help="'cloud' runs against the emulator")
+  parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated row counts for the query '
+                           'benchmarks')
+  parser.add_argument('--repeat', type=int, default=20,
+                      help='timed samples per benchmark')
+  parser.add_argument('--output', help='file to write the JSON results to, '
+                                       'stdout if not given')
+  args = parser.parse_args(argv)
+
+  if args.backend == 'cloud' and not os.getenv('DATASTORE_EMULATOR_HOST'):
+    parser.error('the cloud backend is only benchmarked against the '
+                 'emulator, set DATASTORE_EMULATOR_HOST')
+  os.environ['DATASTORE_BACKEND'] = args.backend
+  os.environ.setdefault('DATASTORE_NAMESPACE', BENCHMARK_NAMESPACE)
+  sizes = [int(size) for size in args.sizes.split(',') if size]
+
+  results = run(sizes, args.repeat)
+  report = {
+      'created': datetime.datetime.utcnow().isoformat(),
+      'backend': args.backend,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'results': results,
+  }
+
+  for result in results:
+    print('{name:<28} {ops_per_sec:>14,.1f} ops/s  p50 {p50_us:>12,.1f}us  '
+          'p99 {p99_us:>12,.1f}us'.format(**result), file=sys.stderr)
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump(report, output, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+  main()
@@ -73,9 +73,7 @@ def perform_authentication():
     response_dict["error_message"] = str(error)
     return jsonify(response_dict), 401
 
-  uid_filter = ('uid', '=', user_id)
-  user = User.retrieve(filters=[uid_filter])[0]
-  g.user_key = user.key().id
+  g.user_key = User.get_by('uid', user_id).key().id
   return True
 
 
@@ -155,17 +153,15 @@ def access_control(role):
 
 
 def get_login_user():
+  user_key = g.get('user_key')
+  if user_key:
+    # Set by the authentication decorators, which already loaded
+    # the user into the request identity map
+    return User.get(User.generate_key(user_key))
+
   auth_type = auth.get_auth_type()
 
   if auth_type == 'verify':
-    token = verify.get_user_token()
-    filter = ('token', '=', token)
-  else:
-    user_id, _ = auth.get_user_id_and_token()
-    filter = ('uid', '=', user_id)
-
-  try:
-    user = User.retrieve(filters=[filter])[0]
-  except IndexError:
-    user = None
-  return user
+    return User.get_by('token', verify.get_user_token())
+  user_id, _ = auth.get_user_id_and_token()
+  return User.get_by('uid', user_id)
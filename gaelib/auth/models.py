@@ -20,15 +20,16 @@ class User(model.Model):
   """
       The database model for User kind.
   """
-  email = properties.StringProperty()
-  uid = properties.StringProperty()
+  # The properties users are found by are looked up with get_by
+  email = properties.StringProperty(lookup_index=True)
+  uid = properties.StringProperty(lookup_index=True)
   name = properties.StringProperty()
   picture = properties.StringProperty()
   role = properties.IntegerProperty(choices=USER_ROLE_CHOICES)
   os = properties.StringProperty()
   device_notification_token = properties.StringProperty()
-  token = properties.StringProperty()
-  phone = properties.StringProperty()
+  token = properties.StringProperty(lookup_index=True)
+  phone = properties.StringProperty(lookup_index=True)
 
   def update_device_token_data(self):
     device_token_data = {}
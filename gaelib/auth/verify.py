@@ -19,9 +19,4 @@ def get_user_token():
 
 def verify_request(token):
   g.app.logger.info("Verifying request")
-  token_filter = ('token', '=', token)
-  try:
-    user = User.retrieve(filters=[token_filter])[0]
-  except IndexError:
-    return None
-  return user
+  return User.get_by('token', token)
@@ -3,6 +3,7 @@ from gaelib.auth.models import User, UserRole
 from gaelib.auth import auth, verify
 from gaelib.env import get_app_or_default_prop, get_profile_picture, get_token_length
 from gaelib.auth.twilio_client import TwilioClient
+from gaelib.db import transactional
 from flask import g, request, session
 
 
@@ -146,29 +147,19 @@ def check_for_new_user_with_uid(logger, user_id, claims, device_token_data):
 
   logger.info("Checking if " + user_id + " is a new user")
 
-  uid_filter = ('uid', '=', user_id)
+  # Lookup errors are raised, as treating them as a miss would
+  # create a second user
+  user = User.get_by('uid', user_id)
 
-  try:
-    user = User.retrieve(filters=[uid_filter])[0]
-  except IndexError:
-    user = None
-  except Exception as e:
-    logger.info("Error trying to retrieve User %s", e)
-
-  if not user:
+  # Tokens of phone sign ins carry no email claim
+  if not user and claims.get('email'):
     # Checking for user being an old cryptic cup member
     # from migration. This is not code that should be in
     # the library long term
-    email_filter = ('email', '=', claims['email'])
-    filters = [email_filter]
-
     ######
     # TODO: Handle multiple users
     ####
-    try:
-      user = User.retrieve(filters=filters)[0]
-    except IndexError:
-      user = None
+    user = User.get_by('email', claims['email'])
 
   name = claims.get('name', '')
   if not name:
@@ -177,27 +168,51 @@ def check_for_new_user_with_uid(logger, user_id, claims, device_token_data):
 
   picture = claims.get('picture', get_profile_picture())
   if user:
-    user.update(
-        uid=user_id,
-        picture=picture,
-        name=name,
-        role=UserRole.DEFAULT.value
-    )
-  else:
-    logger.info("Creating new user")
-    logger.debug("\tUser ID: " + user_id)
-    user = User(
-        uid=user_id,
-        email=claims['email'],
-        picture=picture,
-        name=name,
-        role=UserRole.DEFAULT.value
-    )
+    user = apply_login_changes(user, user_id, picture, name,
+                               device_token_data)
+    if user.is_dirty():
+      user = save_login_changes(user.key(), user_id, picture, name,
+                                device_token_data)
+    return user
+
+  logger.info("Creating new user")
+  logger.debug("\tUser ID: " + user_id)
+  user = User(
+      uid=user_id,
+      email=claims['email'],
+      picture=picture,
+      name=name,
+      role=UserRole.DEFAULT.value
+  )
   user = update_device_token_data(user, device_token_data)
   user.put()
   return user
 
 
+def apply_login_changes(user, user_id, picture, name, device_token_data):
+  user.update(
+      uid=user_id,
+      picture=picture,
+      name=name,
+      role=UserRole.DEFAULT.value
+  )
+  return update_device_token_data(user, device_token_data)
+
+
+@transactional
+def save_login_changes(user_key, user_id, picture, name, device_token_data):
+  """
+      Applies the login changes to the user as read inside a
+      transaction, so concurrent logins can not lose each other's
+      updates.
+  """
+  user = User.get(user_key)
+  user = apply_login_changes(user, user_id, picture, name,
+                             device_token_data)
+  user.put()
+  return user
+
+
 def check_for_new_user_with_phone_or_email(logger, phone, email, device_token_data):
   """
       checks if user with phone exists in datastore.
@@ -206,20 +221,15 @@ def check_for_new_user_with_phone_or_email(logger, phone, email, device_token_da
 
   if phone:
     logger.info("Checking if User with Phone:" + phone + " is a new user")
-    filters = [('phone', '=', phone)]
+    field, value = 'phone', phone
   elif email:
     logger.info("Checking if User with Email:" + email + " is a new user")
-    filters = [('email', '=', email)]
+    field, value = 'email', email
   else:
     logger.error("No Phone/E-mail provided to check new User")
     return None
 
-  try:
-    user = User.retrieve(filters=filters)[0]
-  except IndexError:
-    user = None
-  except Exception as e:
-    logger.info("Error trying to retrieve User %s", e)
+  user = User.get_by(field, value)
 
   if not user:
     logger.info("Creating new user")
@@ -1,6 +1,7 @@
 from flask import g, render_template, request, session
 from gaelib.auth.decorators import auth_required, access_control
 from gaelib.auth.models import User, UserRole
+from gaelib.db import executor, gather
 from gaelib.env import (get_admin_dashboard_post_login_page,
                         get_dev_user_emails)
 from gaelib.view.base_view import BaseHttpHandler
@@ -70,14 +71,14 @@ class Notifications(DashboardView):
         # Get Dev Users
         dev_user_emails = get_dev_user_emails()
         g.app.logger.info("Dev User E-mails are: " + str(dev_user_emails))
-        dev_users = []
-        for email in dev_user_emails:
-          email_filter = ('email', '=', email)
-          users_retrieved = User.retrieve(filters=[email_filter])
-          if users_retrieved:
-            users.append(users_retrieved[0])
+        # The lookups are independent, so they run concurrently
+        futures = [executor.submit(User.get_by, 'email', email)
+                   for email in dev_user_emails]
+        users = [user for user in gather(*futures) if user is not None]
       else:
-        users = User.retrieve()
+        # Streams the user base page by page instead of loading it.
+        # A projection would need a composite index in every app
+        users = User.query().iter()
 
       android_device_tokens, ios_device_tokens = self.get_device_tokens(users)
 
@@ -1,8 +1,19 @@
-from google.cloud import datastore
-from . import helpers
+from . import (batch, clients, constants, executor, helpers, lookup_index,
+               query_cache, transactions, unit_of_work)
+from .executor import gather
+from .lookup_index import UniqueValueError
+from .transactions import run_in_transaction, transaction, transactional
+from .unit_of_work import batched_writes, flush
+from .model import Model
 
 
 def put_multi(entity_list):
-  client = datastore.Client(namespace=helpers.get_datastore_namespace())
-  client.put_multi(entity_list)
+  client = clients.get_client()
+  transactions.check_client(client)
+  for chunk in helpers.chunks(list(entity_list),
+                              constants.MAX_MUTATIONS_PER_COMMIT):
+    client.put_multi(chunk)
+    kinds = {query_cache.kind_key(entity.key) for entity in chunk}
+    if not transactions.on_commit(query_cache.bump_generation, kinds):
+      query_cache.bump_generation(kinds)
   return
@@ -0,0 +1,59 @@
+"""
+    This module defines helpers to run bulk datastore operations
+    in chunks and report the outcome of every item.
+"""
+from . import executor, helpers
+
+
+class BatchResult():
+  """
+      The outcome of a bulk operation for a single item. error is
+      set when the chunk holding the item failed, so failed items
+      can be retried on their own.
+  """
+  __slots__ = ('item', 'value', 'error')
+
+  def __init__(self, item, value=None, error=None):
+    self.item = item
+    self.value = value
+    self.error = error
+
+  @property
+  def ok(self):
+    return self.error is None
+
+  def __repr__(self):
+    if self.ok:
+      return '<BatchResult ok {!r}>'.format(self.item)
+    return '<BatchResult failed {!r}: {!r}>'.format(self.item, self.error)
+
+
+def run_chunked(operation, items, chunk_size, parallel=False):
+  """
+      Calls operation with consecutive chunks of at most chunk_size
+      items and returns one BatchResult per item, in order.
+      operation returns a list of values matching its chunk, or None.
+  """
+  def run_chunk(chunk):
+    try:
+      values = operation(chunk)
+    # pragma pylint: disable=broad-except
+    except Exception as e:
+      return [BatchResult(item, error=e) for item in chunk]
+    if values is None:
+      values = [None] * len(chunk)
+    return [BatchResult(item, value) for item, value in zip(chunk, values)]
+
+  item_chunks = helpers.chunks(list(items), chunk_size)
+  if parallel:
+    chunk_results = executor.run_all(run_chunk, item_chunks)
+  else:
+    chunk_results = [run_chunk(chunk) for chunk in item_chunks]
+  return [result for results in chunk_results for result in results]
+
+
+def failed(results):
+  """
+      Returns the items whose operation failed.
+  """
+  return [result.item for result in results if not result.ok]
@@ -0,0 +1,154 @@
+"""
+    This module defines the process wide entity cache used by models
+    that opt in with __cache__ = True. Writes made through gaelib in
+    this process update the cache, writes from other processes are
+    only picked up once the per-kind ttl expires.
+"""
+import math
+import threading
+import time
+
+import cachetools
+from google.cloud.datastore import helpers as datastore_helpers
+from google.cloud.datastore_v1.types import entity as entity_pb2
+
+from . import constants, helpers
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class CacheBackend():
+  """
+      The interface a cache backend has to implement. Keys are
+      datastore keys and values are datastore entities.
+  """
+
+  def get_multi(self, keys):
+    """
+        Returns a dict of key to entity for the keys that are cached.
+    """
+    raise NotImplementedError
+
+  def set_multi(self, entities, ttl):
+    """
+        Caches a dict of key to entity for ttl seconds.
+    """
+    raise NotImplementedError
+
+  def delete_multi(self, keys):
+    raise NotImplementedError
+
+  def clear(self):
+    raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+  """
+      A size bounded LRU cache held in process memory, where every
+      entry expires after the ttl it was stored with.
+  """
+
+  def __init__(self, maxsize=None, timer=time.monotonic):
+    if maxsize is None:
+      maxsize = constants.ENTITY_CACHE_SIZE
+    # Values are (ttl, entity) so the ttl can vary per kind
+    self._cache = cachetools.TLRUCache(
+        maxsize=maxsize, ttu=lambda _key, value, now: now + value[0],
+        timer=timer)
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._cache)
+
+  def get_multi(self, keys):
+    found = {}
+    with self._lock:
+      for key in keys:
+        value = self._cache.get(key)
+        if value is not None:
+          found[key] = value[1]
+    return {key: helpers.copy_entity(entity) for key, entity in found.items()}
+
+  def set_multi(self, entities, ttl):
+    values = {key: (ttl, helpers.copy_entity(entity))
+              for key, entity in entities.items()}
+    with self._lock:
+      self._cache.update(values)
+
+  def delete_multi(self, keys):
+    with self._lock:
+      for key in keys:
+        self._cache.pop(key, None)
+
+  def clear(self):
+    with self._lock:
+      self._cache.clear()
+
+
+class RedisCacheBackend(CacheBackend):
+  """
+      A cache shared between processes, backed by a redis client or
+      anything with the same get/mget/set/delete interface. Entities
+      are stored as serialized protobufs.
+  """
+
+  def __init__(self, client, prefix='gaelib:entity:'):
+    self.client = client
+    self.prefix = prefix
+
+  def _cache_key(self, key):
+    return self.prefix + key.to_legacy_urlsafe().decode()
+
+  def get_multi(self, keys):
+    keys = list(keys)
+    if not keys:
+      return {}
+    values = self.client.mget([self._cache_key(key) for key in keys])
+    found = {}
+    for key, value in zip(keys, values):
+      if value is not None:
+        entity_pb = entity_pb2.Entity.deserialize(value)
+        found[key] = datastore_helpers.entity_from_protobuf(entity_pb)
+    return found
+
+  def set_multi(self, entities, ttl):
+    ttl = max(1, int(math.ceil(ttl)))
+    for key, entity in entities.items():
+      entity_pb = datastore_helpers.entity_to_protobuf(entity)
+      self.client.set(self._cache_key(key),
+                      entity_pb2.Entity.serialize(entity_pb), ex=ttl)
+
+  def delete_multi(self, keys):
+    cache_keys = [self._cache_key(key) for key in keys]
+    if cache_keys:
+      self.client.delete(*cache_keys)
+
+  def clear(self):
+    # Only the keys written by gaelib are removed
+    cache_keys = list(self.client.scan_iter(match=self.prefix + '*'))
+    if cache_keys:
+      self.client.delete(*cache_keys)
+
+
+def get_backend():
+  """
+      Returns the cache backend, an in-memory one unless
+      set_backend was called.
+  """
+  global _backend
+  if _backend is None:
+    with _backend_lock:
+      if _backend is None:
+        _backend = MemoryCacheBackend()
+  return _backend
+
+
+def set_backend(backend):
+  """
+      Replaces the cache backend used by all models.
+  """
+  global _backend
+  with _backend_lock:
+    _backend = backend
@@ -0,0 +1,77 @@
+"""
+    This module holds the process wide registry of datastore clients,
+    one per project and namespace, so every model and helper shares the
+    same grpc channels. Clients are dropped after a fork, since a
+    channel created in the parent can not be used safely in a child.
+
+    The DATASTORE_BACKEND environment variable picks the backend the
+    clients come from, 'cloud' by default or 'memory'. Other backends
+    can be added with register_backend. The rpcs of every client are
+    recorded per request, see gaelib.db.instrumentation.
+"""
+import os
+import threading
+
+from google.cloud import datastore
+
+from . import helpers, instrumentation, memory
+
+_backends = {
+    'cloud': datastore.Client,
+    'memory': memory.MemoryClient,
+}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+  """
+      Makes a backend selectable by name. factory is called like
+      datastore.Client, with project and namespace keywords, and has
+      to return an object with the same interface.
+  """
+  _backends[name] = factory
+
+
+def get_client(namespace=None, project=None):
+  """
+      Returns the client for project and namespace, creating it on
+      first use. namespace defaults to the app's datastore namespace
+      and project to the one of the environment.
+  """
+  if namespace is None:
+    namespace = helpers.get_datastore_namespace()
+  backend = helpers.get_datastore_backend()
+  client_key = (backend, project, namespace)
+  client = _clients.get(client_key)
+  if client is None:
+    with _clients_lock:
+      client = _clients.get(client_key)
+      if client is None:
+        try:
+          factory = _backends[backend]
+        except KeyError:
+          raise ValueError(
+              "Unknown datastore backend '{}'".format(backend)) from None
+        client = instrumentation.instrument(
+            factory(project=project, namespace=namespace))
+        _clients[client_key] = client
+  return client
+
+
+def clear_clients():
+  """
+      Drops every client, the next get_client creates a new one.
+  """
+  with _clients_lock:
+    _clients.clear()
+
+
+def _reset_after_fork():
+  global _clients, _clients_lock
+  _clients = {}
+  _clients_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1 +1,29 @@
 DEFAULT_DATASTORE_NAMESPACE = 'DEFAULT'
+DEFAULT_DATASTORE_BACKEND = 'cloud'
+
+# Number of ids allocated per allocate_ids rpc for new models
+ID_ALLOCATION_BLOCK_SIZE = 100
+
+# Datastore limits per rpc
+MAX_KEYS_PER_LOOKUP = 1000
+MAX_MUTATIONS_PER_COMMIT = 500
+MAX_IN_FILTER_VALUES = 30
+
+# Upper bound on datastore rpcs gaelib runs in parallel
+MAX_CONCURRENT_RPCS = 8
+
+# Process wide entity cache, used by models with __cache__ = True
+ENTITY_CACHE_SIZE = 10000
+ENTITY_CACHE_TTL = 60
+
+# Entities fetched per rpc when iterating over a query
+QUERY_PAGE_SIZE = 500
+
+# Query result cache, used by models with __query_cache__ = True
+QUERY_CACHE_SIZE = 1024 * 1024
+QUERY_CACHE_TTL = 60
+
+# Attempts and backoff, in seconds, for transactions lost to contention
+TRANSACTION_ATTEMPTS = 5
+TRANSACTION_BASE_DELAY = 0.1
+TRANSACTION_MAX_DELAY = 2.0
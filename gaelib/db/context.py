@@ -0,0 +1,77 @@
+"""
+    This module defines the request scoped identity map that lets
+    repeated lookups of the same entity within a request be served
+    from memory.
+"""
+from flask import g, has_app_context
+
+from . import helpers
+
+_IDENTITY_MAP_ATTR = '_gaelib_identity_map'
+
+
+class IdentityMap():
+  """
+      Holds the last known datastore state of the entities seen in a
+      request, keyed by entity key. A value of None records that the
+      key is known not to exist. Entities are copied on the way in and
+      out so callers can never mutate the cached state.
+  """
+
+  def __init__(self):
+    self._entities = {}
+
+  def __len__(self):
+    return len(self._entities)
+
+  def __contains__(self, key):
+    return key in self._entities
+
+  def get(self, key):
+    """
+        Returns a (hit, entity) tuple for key.
+    """
+    try:
+      entity = self._entities[key]
+    except KeyError:
+      return False, None
+    if entity is None:
+      return True, None
+    return True, helpers.copy_entity(entity)
+
+  def set(self, key, entity):
+    """
+        Records the state of key. Pass None for a missing entity.
+    """
+    if entity is not None:
+      entity = helpers.copy_entity(entity)
+    self._entities[key] = entity
+
+  def discard(self, key):
+    self._entities.pop(key, None)
+
+  def clear(self):
+    self._entities.clear()
+
+
+def get_identity_map():
+  """
+      Returns the identity map of the current request, or None when
+      there is no flask app context.
+  """
+  if not has_app_context():
+    return None
+  identity_map = getattr(g, _IDENTITY_MAP_ATTR, None)
+  if identity_map is None:
+    identity_map = IdentityMap()
+    setattr(g, _IDENTITY_MAP_ATTR, identity_map)
+  return identity_map
+
+
+def clear_identity_map(exception=None):
+  """
+      Drops the identity map of the current request.
+      Registered as a teardown handler by gaelib.utils.web.
+  """
+  if has_app_context():
+    g.pop(_IDENTITY_MAP_ATTR, None)
@@ -0,0 +1,102 @@
+"""
+    This module holds the bounded thread pool that gaelib.db uses
+    to run independent datastore rpcs concurrently.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import constants, transactions
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _mark_worker():
+  _local.in_worker = True
+
+
+def in_worker():
+  """
+      Returns True when called from one of the pool's threads.
+  """
+  return getattr(_local, 'in_worker', False)
+
+
+def get_executor():
+  """
+      Returns the shared thread pool, creating it on first use.
+  """
+  global _executor
+  if _executor is None:
+    with _executor_lock:
+      if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=constants.MAX_CONCURRENT_RPCS,
+            thread_name_prefix='gaelib-db', initializer=_mark_worker)
+  return _executor
+
+
+def submit(fn, *args, **kwargs):
+  """
+      Runs fn on the shared pool and returns a future. The caller's
+      context is copied so the flask app and request contexts stay
+      visible inside the worker. Calls made from a worker run inline,
+      so nested work can not deadlock a saturated pool, and so do
+      calls made in a transaction, which is bound to its thread.
+  """
+  if in_worker() or transactions.in_transaction():
+    future = Future()
+    try:
+      future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+      future.set_exception(e)
+    return future
+  context = contextvars.copy_context()
+  return get_executor().submit(context.run, fn, *args, **kwargs)
+
+
+def run_all(fn, items):
+  """
+      Calls fn once per item concurrently and returns the results
+      in the order of items. A single item is run inline.
+  """
+  items = list(items)
+  if len(items) <= 1:
+    return [fn(item) for item in items]
+  futures = [submit(fn, item) for item in items]
+  return [future.result() for future in futures]
+
+
+def gather(*futures, return_exceptions=False, timeout=None):
+  """
+      Waits for all futures and returns their results in order.
+      With return_exceptions the exception a future raised takes the
+      place of its result, otherwise the first one is raised once
+      every future is done.
+  """
+  results = []
+  error = None
+  for future in futures:
+    try:
+      results.append(future.result(timeout=timeout))
+    except Exception as e:
+      if error is None:
+        error = e
+      results.append(e)
+  if error is not None and not return_exceptions:
+    raise error
+  return results
+
+
+def _reset_after_fork():
+  global _executor, _executor_lock
+  # Worker threads do not survive a fork
+  _executor = None
+  _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,7 +1,95 @@
+import datetime
 import os
 
+from google.cloud import datastore
+
 from . import constants
 
 
 def get_datastore_namespace():
   return os.getenv('DATASTORE_NAMESPACE', default=constants.DEFAULT_DATASTORE_NAMESPACE)
+
+
+def get_datastore_backend():
+  return os.getenv('DATASTORE_BACKEND', default=constants.DEFAULT_DATASTORE_BACKEND)
+
+
+def chunks(items, size):
+  """
+      Splits a list into consecutive lists of at most size items.
+  """
+  return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def copy_entity(entity):
+  """
+      Returns a copy of a datastore entity. Repeated values are copied
+      too so the copy can be changed without touching the original.
+  """
+  copy = datastore.Entity(
+      key=entity.key, exclude_from_indexes=tuple(entity.exclude_from_indexes))
+  for name, value in entity.items():
+    copy[name] = list(value) if isinstance(value, list) else value
+  return copy
+
+
+def _type_rank(value):
+  # The order the datastore uses between values of different types
+  if value is None:
+    return 0
+  if isinstance(value, bool):
+    return 3
+  if isinstance(value, int):
+    return 1
+  if isinstance(value, datetime.datetime):
+    return 2
+  if isinstance(value, bytes):
+    return 4
+  if isinstance(value, str):
+    return 5
+  if isinstance(value, float):
+    return 6
+  if isinstance(value, datastore.Key):
+    return 8
+  return 7
+
+
+def key_path(key):
+  """
+      Returns a value that orders keys the way the datastore does,
+      with ids before names within a kind.
+  """
+  path = []
+  for index in range(0, len(key.flat_path), 2):
+    id_or_name = key.flat_path[index + 1] if index + 1 < len(
+        key.flat_path) else None
+    path.append((key.flat_path[index], isinstance(id_or_name, str),
+                 id_or_name))
+  return tuple(path)
+
+
+def sort_value(value):
+  """
+      Returns a value that orders datastore values of any type the way
+      the datastore does.
+  """
+  if isinstance(value, datastore.Key):
+    return (_type_rank(value), key_path(value))
+  if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+    value = value.replace(tzinfo=None) - value.utcoffset()
+  return (_type_rank(value), value)
+
+
+def order_value(value, descending=False):
+  """
+      Returns the sort_value an entity is ordered by for a property
+      holding value. Like the datastore, a repeated property sorts by
+      its smallest value in ascending and its largest in descending
+      order.
+  """
+  if isinstance(value, list):
+    if not value:
+      return sort_value(None)
+    values = [sort_value(item) for item in value]
+    return max(values) if descending else min(values)
+  return sort_value(value)
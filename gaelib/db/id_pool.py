@@ -0,0 +1,124 @@
+"""
+    This module defines a pool of pre-allocated datastore ids so
+    that creating a new model does not cost an allocate_ids rpc.
+"""
+import collections
+import logging
+import os
+import threading
+
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class IdPool():
+  """
+      A thread-safe pool of complete keys for a single kind.
+      Keys are allocated in blocks and the pool refills itself
+      in the background once it runs low.
+  """
+
+  def __init__(self, client, kind, block_size=None, low_water_mark=None):
+    if block_size is None:
+      block_size = constants.ID_ALLOCATION_BLOCK_SIZE
+    if low_water_mark is None:
+      low_water_mark = block_size // 5
+    self.client = client
+    self.kind = kind
+    self.block_size = block_size
+    self.low_water_mark = low_water_mark
+    self._keys = collections.deque()
+    self._lock = threading.Lock()
+    self._refilling = False
+
+  def __len__(self):
+    return len(self._keys)
+
+  def next_key(self):
+    """
+        Returns a complete key from the pool. If the pool is empty an
+        incomplete key is returned instead, which the datastore
+        completes when the entity is put.
+    """
+    try:
+      key = self._keys.popleft()
+    except IndexError:
+      key = None
+
+    if len(self._keys) <= self.low_water_mark:
+      self.refill_async()
+
+    if key is None:
+      return self.client.key(self.kind)
+    return key
+
+  def refill(self):
+    """
+        Allocates a block of ids and adds them to the pool.
+    """
+    incomplete_key = self.client.key(self.kind)
+    keys = self.client.allocate_ids(incomplete_key, self.block_size)
+    self._keys.extend(keys)
+
+  def refill_async(self):
+    """
+        Refills the pool on a background thread unless a
+        refill is already in progress.
+    """
+    with self._lock:
+      if self._refilling:
+        return
+      self._refilling = True
+    thread = threading.Thread(target=self._background_refill, daemon=True)
+    thread.start()
+
+  def _background_refill(self):
+    try:
+      self.refill()
+    except Exception as e:
+      # New models fall back to incomplete keys until a refill succeeds
+      logger.warning("Failed to allocate ids for %s: %s", self.kind, e)
+    finally:
+      with self._lock:
+        self._refilling = False
+
+
+def get_pool(model_class):
+  """
+      Returns the id pool for the kind and namespace of a model class.
+  """
+  client = model_class.get_client()
+  kind = model_class.__name__
+  pool_key = (client.project, client.namespace, kind)
+  pool = _pools.get(pool_key)
+  if pool is None:
+    with _pools_lock:
+      pool = _pools.get(pool_key)
+      if pool is None:
+        pool = IdPool(client, kind, block_size=model_class.__id_block_size__)
+        _pools[pool_key] = pool
+  return pool
+
+
+def clear_pools():
+  """
+      Drops every pool. Ids that were allocated but not handed
+      out are simply never used.
+  """
+  with _pools_lock:
+    _pools.clear()
+
+
+def _reset_after_fork():
+  global _pools_lock
+  # A forked worker must never hand out the same ids as its parent
+  _pools_lock = threading.Lock()
+  _pools.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,323 @@
+"""
+    This module records the datastore rpcs made while handling a
+    request: lookups, commits, id allocations, query pages and
+    transactions, with the kind, the number of entities, an estimate
+    of their size in bytes and the wall time of every call.
+    gaelib.utils.web logs a summary when the request ends and can add
+    it to the response as a Server-Timing header.
+
+    Clients from gaelib.db.clients are instrumented. get, put and
+    delete go through get_multi, put_multi and delete_multi and are
+    recorded under those names.
+"""
+import threading
+import time
+
+from flask import g, has_app_context
+from google.cloud import datastore
+
+_STATS_ATTR = '_gaelib_rpc_stats'
+
+
+class RpcRecord():
+  """
+      A single datastore rpc.
+  """
+  __slots__ = ('method', 'kind', 'count', 'bytes', 'duration')
+
+  def __init__(self, method, kind, count, size, duration):
+    self.method = method
+    self.kind = kind
+    self.count = count
+    self.bytes = size
+    self.duration = duration
+
+  def __repr__(self):
+    return '<RpcRecord {} {} x{} {:.1f}ms>'.format(
+        self.method, self.kind, self.count, self.duration * 1000)
+
+
+class RequestStats():
+  """
+      The rpcs of one request. Rpcs made on the shared pool's threads
+      are recorded here too, as they run in a copy of the request
+      context.
+  """
+
+  def __init__(self):
+    self._records = []
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._records)
+
+  @property
+  def records(self):
+    with self._lock:
+      return list(self._records)
+
+  def record(self, method, kind, count, size, duration):
+    with self._lock:
+      self._records.append(RpcRecord(method, kind, count, size, duration))
+
+  def summary(self):
+    """
+        Returns the totals of the request with a breakdown per method
+        and kind, where many calls of the same shape point at an N+1
+        access pattern.
+    """
+    calls = {}
+    for record in self.records:
+      call = calls.get((record.method, record.kind))
+      if call is None:
+        call = calls[(record.method, record.kind)] = {
+            'method': record.method, 'kind': record.kind, 'rpcs': 0,
+            'entities': 0, 'bytes': 0, 'ms': 0.0}
+      call['rpcs'] += 1
+      call['entities'] += record.count
+      call['bytes'] += record.bytes
+      call['ms'] += record.duration * 1000
+    calls = sorted(calls.values(), key=lambda call: -call['ms'])
+    for call in calls:
+      call['ms'] = round(call['ms'], 3)
+    return {
+        'rpcs': sum(call['rpcs'] for call in calls),
+        'entities': sum(call['entities'] for call in calls),
+        'bytes': sum(call['bytes'] for call in calls),
+        'ms': round(sum(call['ms'] for call in calls), 3),
+        'calls': calls,
+    }
+
+  def server_timing(self):
+    """
+        Returns the Server-Timing header value for the request's
+        rpcs, with one metric per method and the total.
+    """
+    methods = {}
+    for record in self.records:
+      count, duration = methods.get(record.method, (0, 0.0))
+      methods[record.method] = (count + 1, duration + record.duration)
+    metrics = ['datastore;dur={:.3f};desc="{} rpcs"'.format(
+        sum(duration for _, duration in methods.values()) * 1000,
+        sum(count for count, _ in methods.values()))]
+    for method, (count, duration) in sorted(methods.items()):
+      metrics.append('datastore-{};dur={:.3f};desc="{} rpcs"'.format(
+          method.replace('_', '-'), duration * 1000, count))
+    return ', '.join(metrics)
+
+
+def get_current():
+  """
+      Returns the rpc stats of the current request, or None when
+      there is no flask app context.
+  """
+  if not has_app_context():
+    return None
+  stats = getattr(g, _STATS_ATTR, None)
+  if stats is None:
+    stats = RequestStats()
+    setattr(g, _STATS_ATTR, stats)
+  return stats
+
+
+def finish_request(exception=None):
+  """
+      Drops the rpc stats of the current request and returns their
+      summary, or None when no rpc was made.
+      Registered as a teardown handler by gaelib.utils.web.
+  """
+  if not has_app_context():
+    return None
+  stats = g.pop(_STATS_ATTR, None)
+  if not stats:
+    return None
+  return stats.summary()
+
+
+def _value_size(value):
+  if isinstance(value, (str, bytes)):
+    return len(value)
+  if isinstance(value, list):
+    return sum(_value_size(item) for item in value)
+  if isinstance(value, datastore.Key):
+    return key_size(value)
+  if isinstance(value, datastore.Entity):
+    return entity_size(value)
+  return 8
+
+
+def key_size(key):
+  return sum(len(str(part)) for part in key.flat_path)
+
+
+def entity_size(entity):
+  """
+      Estimates the size of an entity in bytes. Serializing it to
+      measure would cost more than most rpcs take.
+  """
+  size = key_size(entity.key) if entity.key is not None else 0
+  for name, value in entity.items():
+    size += len(name) + _value_size(value)
+  return size
+
+
+def _kind(keys):
+  kinds = {key.kind for key in keys if key is not None}
+  if len(kinds) == 1:
+    return kinds.pop()
+  return ','.join(sorted(kinds)) or None
+
+
+class _RecordedIterator():
+  """
+      Wraps a query iterator so every page it fetches is recorded.
+  """
+
+  def __init__(self, iterator, stats, kind):
+    self._iterator = iterator
+    self._stats = stats
+    self._kind = kind
+
+  @property
+  def next_page_token(self):
+    return self._iterator.next_page_token
+
+  @property
+  def pages(self):
+    pages = iter(self._iterator.pages)
+    while True:
+      start = time.perf_counter()
+      try:
+        page = list(next(pages))
+      except StopIteration:
+        return
+      duration = time.perf_counter() - start
+      self._stats.record('run_query', self._kind, len(page),
+                         sum(entity_size(entity) for entity in page),
+                         duration)
+      yield page
+
+  def __iter__(self):
+    for page in self.pages:
+      for entity in page:
+        yield entity
+
+  def __getattr__(self, name):
+    return getattr(self._iterator, name)
+
+
+def _instrument_query(query):
+  fetch = query.fetch
+
+  def recorded_fetch(*args, **kwargs):
+    iterator = fetch(*args, **kwargs)
+    stats = get_current()
+    if stats is None:
+      return iterator
+    return _RecordedIterator(iterator, stats, query.kind)
+
+  query.fetch = recorded_fetch
+  return query
+
+
+def _instrument_transaction(transaction):
+  def recorded(method, fn, count_mutations=False):
+    def wrapper(*args, **kwargs):
+      stats = get_current()
+      if stats is None:
+        return fn(*args, **kwargs)
+      count = len(transaction.mutations) if count_mutations else 0
+      start = time.perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        stats.record(method, None, count, 0, time.perf_counter() - start)
+    return wrapper
+
+  transaction.begin = recorded('begin_transaction', transaction.begin)
+  transaction.commit = recorded('commit', transaction.commit,
+                                count_mutations=True)
+  transaction.rollback = recorded('rollback', transaction.rollback)
+  return transaction
+
+
+def instrument(client):
+  """
+      Wraps the rpc methods of client, in place, so the calls made
+      while handling a request are recorded. Returns client.
+  """
+  get_multi = client.get_multi
+  put_multi = client.put_multi
+  delete_multi = client.delete_multi
+  allocate_ids = client.allocate_ids
+  query = client.query
+  transaction = client.transaction
+
+  def recorded_get_multi(keys, *args, **kwargs):
+    stats = get_current()
+    if stats is None:
+      return get_multi(keys, *args, **kwargs)
+    keys = list(keys)
+    entities = []
+    start = time.perf_counter()
+    try:
+      entities = get_multi(keys, *args, **kwargs)
+      return entities
+    finally:
+      stats.record('get_multi', _kind(keys), len(keys),
+                   sum(entity_size(entity) for entity in entities or ()),
+                   time.perf_counter() - start)
+
+  def recorded_put_multi(entities, *args, **kwargs):
+    stats = get_current()
+    # In a transaction writes are only sent with the commit
+    if stats is None or client.current_transaction is not None:
+      return put_multi(entities, *args, **kwargs)
+    entities = list(entities)
+    start = time.perf_counter()
+    try:
+      return put_multi(entities, *args, **kwargs)
+    finally:
+      stats.record('put_multi', _kind(entity.key for entity in entities),
+                   len(entities),
+                   sum(entity_size(entity) for entity in entities),
+                   time.perf_counter() - start)
+
+  def recorded_delete_multi(keys, *args, **kwargs):
+    stats = get_current()
+    if stats is None or client.current_transaction is not None:
+      return delete_multi(keys, *args, **kwargs)
+    keys = list(keys)
+    start = time.perf_counter()
+    try:
+      return delete_multi(keys, *args, **kwargs)
+    finally:
+      stats.record('delete_multi', _kind(keys), len(keys),
+                   sum(key_size(key) for key in keys),
+                   time.perf_counter() - start)
+
+  def recorded_allocate_ids(incomplete_key, num_ids, *args, **kwargs):
+    stats = get_current()
+    if stats is None:
+      return allocate_ids(incomplete_key, num_ids, *args, **kwargs)
+    start = time.perf_counter()
+    try:
+      return allocate_ids(incomplete_key, num_ids, *args, **kwargs)
+    finally:
+      stats.record('allocate_ids', incomplete_key.kind, num_ids, 0,
+                   time.perf_counter() - start)
+
+  def recorded_query(*args, **kwargs):
+    return _instrument_query(query(*args, **kwargs))
+
+  def recorded_transaction(*args, **kwargs):
+    return _instrument_transaction(transaction(*args, **kwargs))
+
+  client.get_multi = recorded_get_multi
+  client.put_multi = recorded_put_multi
+  client.delete_multi = recorded_delete_multi
+  client.allocate_ids = recorded_allocate_ids
+  client.query = recorded_query
+  client.transaction = recorded_transaction
+  return client
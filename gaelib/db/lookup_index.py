@@ -0,0 +1,206 @@
+"""
+    This module maintains the lookup index of properties declared with
+    lookup_index=True or unique=True. Every value gets an index entity
+    of a companion kind, named like User_by_email, whose key name is
+    the value and whose owner property holds the key of the model that
+    has it. Model.get_by resolves a value with two key lookups, which
+    the identity map and the caches usually serve, instead of a query.
+
+    Index entities are written in the transaction that puts or deletes
+    the model. Values stored before a property had a lookup index are
+    found by a query the first time and indexed then.
+"""
+from google.cloud import datastore
+
+from . import constants, properties, transactions
+
+_OWNER = 'owner'
+
+
+class UniqueValueError(ValueError):
+  """
+      Raised when a put would give a unique property a value that
+      another model already has.
+  """
+
+
+def index_class(base, model_class, name):
+  """
+      Returns the model class of the index entities for the property
+      name of model_class. They share its client and cache settings.
+  """
+  return type('{}_by_{}'.format(model_class.__name__, name), (base,), {
+      '__doc__': "Lookup index of {}.{}".format(model_class.__name__, name),
+      '__module__': model_class.__module__,
+      '__cache__': model_class.__cache__,
+      '__cache_ttl__': model_class.__cache_ttl__,
+      'get_client': classmethod(lambda cls: model_class.get_client()),
+      _OWNER: properties.ReferenceProperty(reference_class=model_class,
+                                           indexed=False),
+  })
+
+
+def index_key(model_class, name, value):
+  """
+      Returns the key of the index entity for value, or None for a
+      value that is not indexed.
+  """
+  if value is None or value == '':
+    return None
+  if not isinstance(value, str):
+    value = str(value)
+  return model_class.__lookup_indexes__[name].generate_key(value)
+
+
+def chunk_size(model_class):
+  """
+      The number of models whose index changes fit in one commit,
+      as each property may move from one index entity to another.
+  """
+  writes = 1 + 2 * len(model_class.__lookup_indexes__)
+  return max(1, constants.MAX_MUTATIONS_PER_COMMIT // writes)
+
+
+def _index_entity(key, owner):
+  entity = datastore.Entity(key=key, exclude_from_indexes=(_OWNER,))
+  entity[_OWNER] = owner
+  return entity
+
+
+def _record(model_class, entities, deleted_keys):
+  # Refreshes the caches of the index kinds after a commit
+  for index_model in model_class.__lookup_indexes__.values():
+    kind = index_model.__name__
+    kind_entities = [entity for entity in entities if entity.key.kind == kind]
+    kind_keys = [key for key in deleted_keys if key.kind == kind]
+    if kind_entities:
+      index_model._record_put(kind_entities)
+    if kind_keys:
+      index_model._record_delete(kind_keys)
+
+
+def _after_commit(fn, *args):
+  if not transactions.on_commit(fn, *args):
+    fn(*args)
+
+
+def _write_models(model_class, models):
+  client = model_class.get_client()
+  properties_map = model_class.__registry__.properties
+  changes = []
+  read_keys = {}
+  for model in models:
+    owner = model.__entity__.key
+    for name, old, new in model._lookup_changes():
+      old_key = index_key(model_class, name, old)
+      new_key = index_key(model_class, name, new)
+      if old_key == new_key:
+        continue
+      changes.append((owner, name, old_key, new_key))
+      if old_key is not None:
+        read_keys[old_key] = None
+      if new_key is not None and properties_map[name]._unique:
+        read_keys[new_key] = None
+
+  current = {}
+  if read_keys:
+    current = {entity.key: entity[_OWNER]
+               for entity in client.get_multi(list(read_keys))}
+
+  puts = {}
+  deletes = []
+  for owner, name, old_key, new_key in changes:
+    if new_key is not None:
+      holder = puts.get(new_key)
+      if holder is None:
+        holder = current.get(new_key)
+      if (properties_map[name]._unique and holder is not None and
+          holder != owner):
+        raise UniqueValueError("{}.{} value {!r} is already used".format(
+            model_class.__name__, name, new_key.name))
+      puts[new_key] = owner
+    if old_key is not None and current.get(old_key) == owner:
+      deletes.append(old_key)
+  deletes = [key for key in deletes if key not in puts]
+
+  index_entities = [_index_entity(key, owner) for key, owner in puts.items()]
+  client.put_multi([model.__entity__ for model in models] + index_entities)
+  if deletes:
+    client.delete_multi(deletes)
+  _after_commit(model_class._saved_multi, models)
+  _after_commit(_record, model_class, index_entities, deletes)
+
+
+def put_models(model_class, models):
+  """
+      Puts models together with their index changes in a transaction,
+      joining the current one if there is one. Raises
+      UniqueValueError, and writes nothing, when a unique value is
+      taken by another model.
+  """
+  client = model_class.get_client()
+  for model in models:
+    # Index entities point at the owner, so its key has to be complete
+    key = model.__entity__.key
+    if key.is_partial:
+      model.__entity__.key = client.allocate_ids(key, 1)[0]
+  transactions.run_in_transaction(
+      _write_models, model_class, models, client=client,
+      name='{}.put_with_lookup_index'.format(model_class.__name__))
+
+
+def _delete_keys(model_class, keys):
+  client = model_class.get_client()
+  owners = {}
+  for entity in client.get_multi(keys):
+    for name in model_class.__lookup_indexes__:
+      key = index_key(model_class, name, entity.get(name))
+      if key is not None:
+        owners[key] = entity.key
+
+  deletes = []
+  if owners:
+    deletes = [entity.key for entity in client.get_multi(list(owners))
+               if entity[_OWNER] == owners[entity.key]]
+  client.delete_multi(list(keys) + deletes)
+  _after_commit(model_class._record_delete, keys)
+  _after_commit(_record, model_class, [], deletes)
+
+
+def delete_keys(model_class, keys):
+  """
+      Deletes keys together with the index entities that point at
+      them in a transaction, joining the current one if there is one.
+  """
+  transactions.run_in_transaction(
+      _delete_keys, model_class, list(keys), client=model_class.get_client(),
+      name='{}.delete_with_lookup_index'.format(model_class.__name__))
+
+
+def get_by(model_class, name, value):
+  """
+      Returns the model whose property name has value, or None.
+      The index entity is trusted only while its owner still has the
+      value. Otherwise, or when there is none, a query finds the model
+      and the index is repaired.
+  """
+  key = index_key(model_class, name, value)
+  if key is None:
+    return None
+  index_model = model_class.__lookup_indexes__[name].get(key)
+  if index_model is not None:
+    owner = model_class.get(index_model.owner)
+    if owner is not None and owner.__entity__.get(name) == value:
+      return owner
+
+  query = model_class.query()
+  query.add_filter(name, '=', value)
+  found = query.fetch(limit=1)
+  if not found:
+    return None
+  owner = found[0]
+  if not transactions.in_transaction():
+    entity = _index_entity(key, owner.key())
+    model_class.get_client().put(entity)
+    _record(model_class, [entity], [])
+  return owner
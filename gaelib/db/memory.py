@@ -0,0 +1,421 @@
+"""
+    This module defines an in-process datastore backend that keeps
+    entities in memory. MemoryClient implements the part of the
+    google.cloud.datastore.Client interface gaelib uses, so tests and
+    benchmarks can run without the emulator. Select it by setting the
+    DATASTORE_BACKEND environment variable to 'memory'.
+
+    Queries see every write immediately and cursors are offsets into
+    the ordered results, so they are only stable while the results
+    do not change.
+"""
+import base64
+import itertools
+import threading
+
+from google.api_core import exceptions
+from google.cloud import datastore
+
+from . import constants, helpers
+from .helpers import key_path, order_value, sort_value
+
+_KEY_FILTER = '__key__'
+
+
+def _compare(op, value, target):
+  op = op.upper()
+  if op == 'IN':
+    return any(_compare('=', value, item) for item in target)
+  if op == 'NOT_IN':
+    return not any(_compare('=', value, item) for item in target)
+  left, right = sort_value(value), sort_value(target)
+  if op == '=':
+    return left == right
+  if op == '!=':
+    return left != right
+  if left[0] != right[0]:
+    # Inequalities only match values of the same type
+    return False
+  if op == '<':
+    return left < right
+  if op == '<=':
+    return left <= right
+  if op == '>':
+    return left > right
+  if op == '>=':
+    return left >= right
+  raise ValueError("Unsupported filter operator {}".format(op))
+
+
+def _copy(entity):
+  return helpers.copy_entity(entity)
+
+
+class MemoryStore():
+  """
+      The entities of every project and namespace, with a version per
+      key so transactions can detect conflicting writes.
+  """
+
+  def __init__(self):
+    self.entities = {}
+    self.versions = {}
+    self.lock = threading.RLock()
+    self._ids = itertools.count(1)
+
+  @staticmethod
+  def path(key):
+    return (key.project, key.namespace, key.flat_path)
+
+  def next_id(self):
+    with self.lock:
+      return next(self._ids)
+
+  def write(self, entities, keys):
+    with self.lock:
+      for entity in entities:
+        if entity.key.is_partial:
+          entity.key = entity.key.completed_key(self.next_id())
+        path = self.path(entity.key)
+        self.entities[path] = _copy(entity)
+        self.versions[path] = self.versions.get(path, 0) + 1
+      for key in keys:
+        path = self.path(key)
+        if self.entities.pop(path, None) is not None:
+          self.versions[path] = self.versions.get(path, 0) + 1
+
+  def clear(self):
+    with self.lock:
+      self.entities.clear()
+      self.versions.clear()
+
+
+_default_store = MemoryStore()
+
+
+def get_default_store():
+  return _default_store
+
+
+class MemoryTransaction():
+  """
+      An optimistic transaction. Writes are applied on commit, which
+      raises Aborted if an entity it read was written in the meantime.
+  """
+
+  def __init__(self, client, read_only=False):
+    self._client = client
+    self.read_only = read_only
+    self._puts = []
+    self._deletes = []
+    self._read_versions = {}
+    self._active = False
+
+  @property
+  def mutations(self):
+    return self._puts + self._deletes
+
+  def begin(self):
+    self._active = True
+    self._client._transactions.append(self)
+
+  def _end(self):
+    self._active = False
+    self._client._transactions.remove(self)
+
+  def _read(self, key):
+    path = MemoryStore.path(key)
+    store = self._client.store
+    self._read_versions.setdefault(path, store.versions.get(path, 0))
+
+  def put(self, entity):
+    if self.read_only:
+      raise RuntimeError("Can not write in a read only transaction")
+    self._puts.append(entity)
+
+  def delete(self, key):
+    if self.read_only:
+      raise RuntimeError("Can not write in a read only transaction")
+    self._deletes.append(key)
+
+  def commit(self):
+    store = self._client.store
+    try:
+      with store.lock:
+        for path, version in self._read_versions.items():
+          if store.versions.get(path, 0) != version:
+            raise exceptions.Aborted(
+                "Transaction lost a contention race on {}".format(path))
+        store.write(self._puts, self._deletes)
+    finally:
+      self._end()
+
+  def rollback(self):
+    self._end()
+
+  def __enter__(self):
+    self.begin()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.commit()
+    else:
+      self.rollback()
+
+
+class MemoryIterator():
+  """
+      Mimics the iterator returned by Query.fetch: the results can be
+      iterated directly or as a single page, after which
+      next_page_token holds the cursor to the next results, or None.
+  """
+
+  def __init__(self, query, limit=None, offset=0, start_cursor=None):
+    self._query = query
+    self._limit = limit
+    self._offset = offset or 0
+    self._start_cursor = start_cursor
+    self._started = False
+    self.next_page_token = None
+
+  def _page(self):
+    results = self._query._run()
+    start = self._offset
+    if self._start_cursor:
+      cursor = self._start_cursor
+      if isinstance(cursor, str):
+        cursor = cursor.encode('ascii')
+      start += int(base64.urlsafe_b64decode(cursor).decode('ascii'))
+    end = len(results)
+    if self._limit is not None:
+      end = min(end, start + self._limit)
+    if end < len(results):
+      self.next_page_token = base64.urlsafe_b64encode(
+          str(end).encode('ascii'))
+    return results[start:end]
+
+  @property
+  def pages(self):
+    if self._started:
+      return
+    self._started = True
+    yield self._page()
+
+  def __iter__(self):
+    for page in self.pages:
+      for result in page:
+        yield result
+
+
+class MemoryQuery():
+  """
+      Mimics google.cloud.datastore.Query over a MemoryStore.
+  """
+
+  def __init__(self, client, kind=None, project=None, namespace=None,
+               ancestor=None, filters=(), projection=(), order=(),
+               distinct_on=(), **kwargs):
+    self._client = client
+    self.kind = kind
+    self.project = project or client.project
+    self.namespace = namespace if namespace is not None else client.namespace
+    self.ancestor = ancestor
+    self.filters = list(filters)
+    self._projection = list(projection)
+    self._order = list(order)
+    self.distinct_on = list(distinct_on)
+
+  def add_filter(self, property_name=None, operator=None, value=None,
+                 filter=None):
+    if filter is not None:
+      property_name, operator, value = (filter.property_name, filter.operator,
+                                        filter.value)
+    self.filters.append((property_name, operator, value))
+    return self
+
+  @property
+  def order(self):
+    return self._order[:]
+
+  @order.setter
+  def order(self, value):
+    if isinstance(value, str):
+      value = [value]
+    self._order[:] = value
+
+  @property
+  def projection(self):
+    return self._projection[:]
+
+  @projection.setter
+  def projection(self, value):
+    if isinstance(value, str):
+      value = [value]
+    self._projection[:] = value
+
+  def keys_only(self):
+    self._projection[:] = [_KEY_FILTER]
+
+  def fetch(self, limit=None, offset=0, start_cursor=None, **kwargs):
+    return MemoryIterator(self, limit=limit, offset=offset,
+                          start_cursor=start_cursor)
+
+  def _matches(self, entity):
+    if self.ancestor is not None:
+      path = self.ancestor.flat_path
+      if entity.key.flat_path[:len(path)] != path:
+        return False
+    for name, op, target in self.filters:
+      if name == _KEY_FILTER:
+        values = [entity.key]
+      elif name not in entity or name in entity.exclude_from_indexes:
+        # Missing and unindexed properties never match a filter
+        return False
+      else:
+        values = entity[name]
+        if not isinstance(values, list):
+          values = [values]
+      if not any(_compare(op, value, target) for value in values):
+        return False
+    return True
+
+  def _entities(self):
+    store = self._client.store
+    with store.lock:
+      if self.kind == '__kind__':
+        kinds = sorted({path[2][0] for path in store.entities
+                        if path[:2] == (self.project, self.namespace)})
+        return [datastore.Entity(key=self._client.key(
+            '__kind__', kind, namespace=self.namespace)) for kind in kinds]
+      return [entity for path, entity in store.entities.items()
+              if path[:2] == (self.project, self.namespace) and
+              path[2][-2] == self.kind and self._matches(entity)]
+
+  def _run(self):
+    entities = self._entities()
+    transaction = self._client.current_transaction
+    if transaction is not None:
+      for entity in entities:
+        transaction._read(entity.key)
+
+    entities.sort(key=lambda entity: key_path(entity.key))
+    for field in reversed(self._order):
+      name = field.lstrip('-')
+      if name == _KEY_FILTER:
+        entities.sort(key=lambda entity: key_path(entity.key),
+                      reverse=field.startswith('-'))
+        continue
+      entities = [entity for entity in entities if name in entity]
+      descending = field.startswith('-')
+      entities.sort(
+          key=lambda entity: order_value(entity[name], descending),
+          reverse=descending)
+
+    projection = self._projection
+    if projection == [_KEY_FILTER]:
+      return [datastore.Entity(key=entity.key) for entity in entities]
+    if not projection:
+      return [_copy(entity) for entity in entities]
+
+    results = []
+    for entity in entities:
+      if not all(name in entity and name not in entity.exclude_from_indexes
+                 for name in projection):
+        continue
+      result = datastore.Entity(key=entity.key)
+      for name in projection:
+        result[name] = entity[name]
+      results.append(result)
+    return results
+
+
+class MemoryClient():
+  """
+      An in-memory stand in for google.cloud.datastore.Client.
+      Clients share the process wide store unless given one.
+  """
+
+  def __init__(self, project=None, namespace=None, store=None, **kwargs):
+    self.project = project or 'memory'
+    self.namespace = namespace
+    self.store = store if store is not None else _default_store
+    self._local = threading.local()
+
+  @property
+  def _transactions(self):
+    # Like the cloud client, transactions are bound to their thread
+    if not hasattr(self._local, 'transactions'):
+      self._local.transactions = []
+    return self._local.transactions
+
+  @property
+  def current_transaction(self):
+    transactions = self._transactions
+    return transactions[-1] if transactions else None
+
+  def key(self, *path_args, **kwargs):
+    kwargs.setdefault('project', self.project)
+    kwargs.setdefault('namespace', self.namespace)
+    return datastore.Key(*path_args, **kwargs)
+
+  def get(self, key, missing=None, deferred=None, **kwargs):
+    entities = self.get_multi([key], missing=missing, deferred=deferred)
+    return entities[0] if entities else None
+
+  def get_multi(self, keys, missing=None, deferred=None, **kwargs):
+    keys = list(keys)
+    if len(keys) > constants.MAX_KEYS_PER_LOOKUP:
+      raise exceptions.InvalidArgument(
+          "Can not look up more than {} keys".format(
+              constants.MAX_KEYS_PER_LOOKUP))
+    transaction = self.current_transaction
+    found = []
+    with self.store.lock:
+      for key in keys:
+        if transaction is not None:
+          transaction._read(key)
+        entity = self.store.entities.get(MemoryStore.path(key))
+        if entity is not None:
+          found.append(_copy(entity))
+        elif missing is not None:
+          missing.append(datastore.Entity(key=key))
+    return found
+
+  def put(self, entity, **kwargs):
+    self.put_multi([entity])
+
+  def put_multi(self, entities, **kwargs):
+    entities = list(entities)
+    transaction = self.current_transaction
+    if transaction is not None:
+      for entity in entities:
+        transaction.put(entity)
+      return
+    if len(entities) > constants.MAX_MUTATIONS_PER_COMMIT:
+      raise exceptions.InvalidArgument(
+          "Can not write more than {} entities".format(
+              constants.MAX_MUTATIONS_PER_COMMIT))
+    self.store.write(entities, [])
+
+  def delete(self, key, **kwargs):
+    self.delete_multi([key])
+
+  def delete_multi(self, keys, **kwargs):
+    keys = list(keys)
+    transaction = self.current_transaction
+    if transaction is not None:
+      for key in keys:
+        transaction.delete(key)
+      return
+    self.store.write([], keys)
+
+  def allocate_ids(self, incomplete_key, num_ids, **kwargs):
+    return [incomplete_key.completed_key(self.store.next_id())
+            for _ in range(num_ids)]
+
+  def query(self, **kwargs):
+    return MemoryQuery(self, **kwargs)
+
+  def transaction(self, read_only=False, **kwargs):
+    return MemoryTransaction(self, read_only=read_only)
@@ -3,9 +3,58 @@
     database models and upload entities to the datastore.
 """
 from google.cloud import datastore
-from gaelib.db import properties, helpers
+from gaelib.db import (batch, cache, clients, constants, context, executor,
+                       id_pool, lookup_index, properties, query_cache,
+                       transactions, unit_of_work)
 
-from .query import Query
+from .query import Query, merge_results, split_in_filters
+
+_MISSING = object()
+
+
+def _serialize_entity(entity, plan):
+  get = entity.get
+  result = {}
+  for name, convert in plan:
+    value = get(name)
+    if convert is not None and value is not None:
+      value = convert(value)
+    result[name] = value
+  return result
+
+
+def _prefetch(models, paths):
+  """
+      Attaches the targets of the reference fields in paths, a tree
+      of field names, to models and then recurses into the targets.
+  """
+  keys_by_class = {}
+  for name in paths:
+    for model in models:
+      reference_class = model._reference_property(name).reference_class
+      value = model.__entity__.get(name)
+      keys = keys_by_class.setdefault(reference_class, {})
+      for key in (value if isinstance(value, list) else [value]):
+        if key is not None:
+          keys[key] = None
+
+  found = {}
+  for reference_class, keys in keys_by_class.items():
+    for result in reference_class.get_multi(list(keys)):
+      if not result.ok:
+        raise result.error
+      found[result.item] = result.value
+
+  for name, sub_paths in paths.items():
+    targets = {}
+    for model in models:
+      loaded = model._attach_reference(name, model.__entity__.get(name),
+                                       found)
+      for target in (loaded if isinstance(loaded, list) else [loaded]):
+        if target is not None:
+          targets[id(target)] = target
+    if sub_paths:
+      _prefetch(list(targets.values()), sub_paths)
 
 
 class Model():
@@ -14,12 +63,48 @@ class Model():
       database models and upload entities to the datastore.
   """
   __client__ = None
+  # Opt in to the process wide entity cache
+  __cache__ = False
+  __cache_ttl__ = constants.ENTITY_CACHE_TTL
+  # Opt in to the query result cache, the size is in bytes per kind
+  __query_cache__ = False
+  __query_cache_ttl__ = constants.QUERY_CACHE_TTL
+  __query_cache_size__ = constants.QUERY_CACHE_SIZE
+  __id_block_size__ = constants.ID_ALLOCATION_BLOCK_SIZE
+  # Targets of reference properties, see reference
+  __references__ = None
+  __registry__ = properties.PropertyRegistry({})
+  # Index model classes of the properties with a lookup index
+  __lookup_indexes__ = {}
+
+  def __init_subclass__(cls, **kwargs):
+    """
+        Builds the property registry once per class,
+        honouring overrides in subclasses.
+    """
+    super().__init_subclass__(**kwargs)
+    properties_map = {}
+    for klass in reversed(cls.__mro__):
+      for name, attribute in vars(klass).items():
+        if isinstance(attribute, properties.Property):
+          if attribute._name is None:
+            attribute._name = name
+          properties_map[name] = attribute
+        else:
+          properties_map.pop(name, None)
+    cls.__registry__ = properties.PropertyRegistry(properties_map)
+    cls.__lookup_indexes__ = {
+        name: lookup_index.index_class(Model, cls, name)
+        for name in cls.__registry__.lookup_indexes}
 
   def __init__(self, key=None, key_str='', **kwargs):
     object.__setattr__(self, "__entity_key__", None)
     object.__setattr__(self, "__entity__", None)
     object.__setattr__(self, "__retrieved__", False)
-    client = self.get_client()
+    # Values properties had before they were changed, and whether
+    # the entity is known to be stored as it was loaded
+    object.__setattr__(self, "__changes__", {})
+    object.__setattr__(self, "__stored__", False)
     """
             1. First we check for a passed key and set that as the key
             2. Then we check for a passed key str and use that to build
@@ -28,10 +113,12 @@ class Model():
                the entity. This is to be done only if we are not looking
                for the most recently fetched value of entity. Staleness
                must be expected
-            4. Then we try to fetch the entity based on the set key
-            5. Only if we see that there was no entity fetched, do we use
-               allocate_ids to generate a key. This way we don't unnecessarily
-               waste an rpc call on a key we are sure doesn't exist in the DS.
+            4. Then we try to fetch the entity based on the set key,
+               from the request identity map if it was already seen
+            5. Only if no key was passed do we take a key from the id
+               pool. The pool allocates ids in blocks in the background,
+               so this normally costs no rpc. If the pool is empty the key
+               is left incomplete and gets completed on put.
         """
     # Setting a key provided in init
     if key:
@@ -47,54 +134,202 @@ class Model():
       self.__entity__ = entity
     elif self.__entity_key__:
       # Fetch only if the key or key_str were provided to init
-      self.__entity__ = client.get(self.__entity_key__)
+      self.__entity__ = self._lookup_entity(self.__entity_key__)
     else:
       # Only create the entity key if it was not already created
       # base on key str. This will not be dependent on whether the
       # entity was fetched or not.
-      incomplete_key = self.get_client().key(
-          (object.__getattribute__(self, '__class__').__name__))
-      self.__entity_key__ = client.allocate_ids(incomplete_key, 1)[0]
+      self.__entity_key__ = id_pool.get_pool(type(self)).next_key()
 
+    registry = self.__registry__
     if self.__entity__:
       # This means that the datastore already had the entity for this key
       self.__retrieved__ = True
+      self.__stored__ = True
+      if registry.unindexed:
+        self.__entity__.exclude_from_indexes.update(registry.unindexed)
     else:
-      self.__entity__ = datastore.Entity(key=self.__entity_key__)
+      self.__entity__ = datastore.Entity(
+          key=self.__entity_key__, exclude_from_indexes=registry.unindexed)
       # Setting the default values for properties for absolutely
       # fresh entity
-      all_attributes = dir(self)
-      for attr in all_attributes:
-        attribute = object.__getattribute__(self, attr)
-        if isinstance(attribute, properties.Property):
-          if attribute._default is not None:
-            self.__entity__[attr] = attribute._default
+      if registry.defaults:
+        self.__entity__.update(registry.defaults)
 
     # kwargs items will overwrite those that were already in the entity
-    for key, val in kwargs.items():
-      attribute = object.__getattribute__(self, key)
-      if isinstance(attribute, properties.Property):
-        self.__entity__[key] = attribute.validate(val)
+    self._set_properties(kwargs)
+
+  @classmethod
+  def from_entity(cls, entity):
+    """
+        Builds the model for an entity loaded from the datastore
+        without running __init__, so no lookup, key allocation or
+        property handling happens.
+    """
+    unindexed = cls.__registry__.unindexed
+    if unindexed:
+      entity.exclude_from_indexes.update(unindexed)
+    model = object.__new__(cls)
+    model.__dict__ = {'__entity_key__': entity.key, '__entity__': entity,
+                      '__retrieved__': True, '__changes__': {},
+                      '__stored__': True}
+    return model
+
+  @classmethod
+  def from_entities(cls, entities):
+    """
+        Builds the models for a list of loaded entities,
+        see from_entity.
+    """
+    unindexed = cls.__registry__.unindexed
+    new = object.__new__
+    models = []
+    for entity in entities:
+      if unindexed:
+        entity.exclude_from_indexes.update(unindexed)
+      model = new(cls)
+      model.__dict__ = {'__entity_key__': entity.key, '__entity__': entity,
+                        '__retrieved__': True, '__changes__': {},
+                        '__stored__': True}
+      models.append(model)
+    return models
+
+  def _set_properties(self, values):
+    """
+        Validates and writes property values to the entity.
+        Names that are not properties are ignored, unknown
+        names raise an AttributeError.
+    """
+    validators = self.__registry__.validators
+    for name, value in values.items():
+      validator = validators.get(name)
+      if validator is not None:
+        self._write_property(name, validator(value))
+      elif not hasattr(self, name):
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
+
+  def _write_property(self, name, value):
+    """
+        Writes a validated value to the entity, remembering the value
+        it replaces. Writing back the original value undoes the change.
+    """
+    entity = self.__entity__
+    current = entity.get(name, _MISSING)
+    if current is not _MISSING and current == value:
+      return
+    changes = self.__changes__
+    original = changes.setdefault(name, current)
+    entity[name] = value
+    if original is not _MISSING and original == value:
+      del changes[name]
+
+  def is_dirty(self):
+    """
+        Returns True if the model has to be written to be stored,
+        either because it is new or because properties changed since
+        it was loaded or last put. Changes made to the entity directly,
+        or to a list value in place, are not tracked.
+    """
+    return not self.__stored__ or bool(self.__changes__)
+
+  def changed_fields(self):
+    """
+        Returns the names of the properties changed since the model
+        was loaded or last put.
+    """
+    return list(self.__changes__)
 
-  def __getattribute__(self, attr):
+  def to_dict(self, fields=None):
     """
-        The modified __getattr__ function to view the value of
-        of the attributes in the model.
+        Returns the property values of the model, or only of the
+        properties named in fields, as a dict.
     """
-    attribute = super().__getattribute__(attr)
-    if isinstance(attribute, properties.Property):
-      return self.__entity__.get(attr, None)
-    return attribute
+    if fields is None:
+      fields = self.__registry__.properties
+    else:
+      self._json_plan(fields)
+    get = self.__entity__.get
+    return {name: get(name) for name in fields}
+
+  def to_json(self, fields=None):
+    """
+        Returns a dict like to_dict with JSON safe values, where
+        datetimes are in ISO 8601 and keys are URL-safe strings.
+    """
+    return _serialize_entity(self.__entity__, self._json_plan(fields))
+
+  @classmethod
+  def serialize_many(cls, models, fields=None):
+    """
+        Returns the to_json dicts of models for a bulk response,
+        working out the serialization plan once per class. Objects
+        whose class overrides to_json are serialized with it.
+    """
+    plans = {}
+    results = []
+    for model in models:
+      model_class = type(model)
+      plan = plans.get(model_class)
+      if plan is None:
+        if getattr(model_class, 'to_json', None) is Model.to_json:
+          plan = model_class._json_plan(fields)
+        else:
+          plan = False
+        plans[model_class] = plan
+      if plan is False:
+        results.append(model.to_json())
+      else:
+        results.append(_serialize_entity(model.__entity__, plan))
+    return results
+
+  @classmethod
+  def _json_plan(cls, fields=None):
+    plan = cls.__registry__.json_plan
+    if fields is None:
+      return plan
+    properties_map = cls.__registry__.properties
+    for name in fields:
+      if name not in properties_map:
+        raise AttributeError("'{}' object has no property '{}'".format(
+            cls.__name__, name))
+    return tuple((name, properties_map[name]._json_converter)
+                 for name in fields)
+
+  def _lookup_changes(self):
+    """
+        Returns (name, old, new) tuples for the properties with a
+        lookup index whose value changed since the model was stored.
+        old is None when the model is new, so new models without
+        indexed values have no changes.
+    """
+    changes = self.__changes__
+    entity = self.__entity__
+    result = []
+    for name in self.__registry__.lookup_indexes:
+      if name in changes:
+        old = changes[name]
+        if old is _MISSING:
+          old = None
+      elif not self.__stored__:
+        old = None
+      else:
+        continue
+      new = entity.get(name)
+      if old != new:
+        result.append((name, old, new))
+    return result
+
+  def _mark_clean(self):
+    self.__entity_key__ = self.__entity__.key
+    self.__changes__ = {}
+    self.__stored__ = True
 
   def update(self, **kwargs):
     """
         The function to update multiple attributes of an entity at once.
     """
-    for key, val in kwargs.items():
-      attribute = object.__getattribute__(self, key)
-
-      if isinstance(attribute, properties.Property):
-        self.__entity__[key] = attribute.validate(val)
+    self._set_properties(kwargs)
 
   def key(self):
     """
@@ -109,38 +344,296 @@ class Model():
     """
     return cls.get_client().key(cls.__name__, key_str)
 
-  def put(self):
+  def put(self, force=False):
     """
-        The function to insert the entity in cloud datastore
+        The function to insert the entity in cloud datastore.
+        Unchanged models that are already stored are not written
+        again unless force is set.
     """
+    if not force and not self.is_dirty():
+      return
+    work = unit_of_work.get_current()
+    if work is not None and not transactions.in_transaction():
+      work.put(self)
+      return
+    if self.__lookup_indexes__ and self._lookup_changes():
+      lookup_index.put_models(type(self), [self])
+      return
     client = self.get_client()
+    transactions.check_client(client)
     client.put(self.__entity__)
+    # In a transaction the write only lands, and an incomplete key is
+    # only completed, once the transaction commits
+    if not transactions.on_commit(self._saved_multi, [self]):
+      self._saved_multi([self])
+
+  @classmethod
+  def _saved_multi(cls, models):
+    for model in models:
+      model._mark_clean()
+    cls._record_put([model.__entity__ for model in models])
 
   @classmethod
   def get(cls, key):
+    """
+        Gets the model for key, or None if it does not exist.
+    """
+    result = cls.get_multi([key], parallel=False)[0]
+    if not result.ok:
+      raise result.error
+    return result.value
+
+  @classmethod
+  def _cached_entities(cls, keys):
+    """
+        Returns a dict of key to entity, or None for keys known to be
+        missing, for the keys with a pending write in the current unit
+        of work, held by the request identity map or, for models that
+        opt in, the process cache. Inside a transaction every read
+        goes to the datastore.
+    """
+    if transactions.in_transaction():
+      return {}
+    found = {}
+    work = unit_of_work.get_current()
+    if work is not None:
+      for key in keys:
+        hit, entity = work.get(key)
+        if hit:
+          found[key] = entity
+
+    identity_map = context.get_identity_map()
+    if identity_map is not None:
+      for key in keys:
+        if key in found:
+          continue
+        hit, entity = identity_map.get(key)
+        if hit:
+          found[key] = entity
+
+    if cls.__cache__:
+      missed_keys = [key for key in keys if key not in found]
+      if missed_keys:
+        cached = cache.get_backend().get_multi(missed_keys)
+        for key, entity in cached.items():
+          found[key] = entity
+          if identity_map is not None:
+            identity_map.set(key, entity)
+    return found
+
+  @classmethod
+  def _record_lookup(cls, keys, found):
+    """
+        Stores the outcome of a datastore lookup in the caches.
+    """
+    if transactions.in_transaction():
+      return
+    identity_map = context.get_identity_map()
+    if identity_map is not None:
+      for key in keys:
+        identity_map.set(key, found.get(key))
+    if cls.__cache__ and found:
+      cache.get_backend().set_multi(found, cls.__cache_ttl__)
+
+  @classmethod
+  def _record_put(cls, entities):
+    """
+        Refreshes the caches with entities that were just written.
+    """
+    query_cache.bump_generation(
+        {query_cache.kind_key(entity.key) for entity in entities})
+    identity_map = context.get_identity_map()
+    if identity_map is not None:
+      for entity in entities:
+        identity_map.set(entity.key, entity)
+    if cls.__cache__:
+      cache.get_backend().set_multi(
+          {entity.key: entity for entity in entities}, cls.__cache_ttl__)
+
+  @classmethod
+  def _record_delete(cls, keys):
+    """
+        Marks keys that were just deleted as missing in the caches.
+    """
+    query_cache.bump_generation({query_cache.kind_key(key) for key in keys})
+    identity_map = context.get_identity_map()
+    if identity_map is not None:
+      for key in keys:
+        identity_map.set(key, None)
+    if cls.__cache__:
+      cache.get_backend().delete_multi(keys)
+
+  @classmethod
+  def _lookup_entity(cls, key):
+    """
+        Gets the entity for key, serving it from the caches
+        when possible.
+    """
+    cached = cls._cached_entities([key])
+    if key in cached:
+      return cached[key]
+    entity = cls.get_client().get(key)
+    cls._record_lookup([key], {key: entity} if entity is not None else {})
+    return entity
+
+  @classmethod
+  def put_multi(cls, models, parallel=False, force=False):
+    """
+        Puts models in chunks that fit the datastore mutation limit.
+        Returns a BatchResult per model holding its key. Unchanged
+        models that are already stored are skipped unless force is set.
+    """
+    client = cls.get_client()
+    models = list(models)
+
+    chunk_size = constants.MAX_MUTATIONS_PER_COMMIT
+    if cls.__lookup_indexes__:
+      chunk_size = lookup_index.chunk_size(cls)
+
+    def put_chunk(chunk):
+      if cls.__lookup_indexes__ and any(model._lookup_changes()
+                                        for model in chunk):
+        lookup_index.put_models(cls, chunk)
+        return [model.__entity_key__ for model in chunk]
+      transactions.check_client(client)
+      client.put_multi([model.__entity__ for model in chunk])
+      if not transactions.on_commit(cls._saved_multi, chunk):
+        cls._saved_multi(chunk)
+      return [model.__entity_key__ for model in chunk]
+
+    dirty_models = [model for model in models if force or model.is_dirty()]
+    results = batch.run_chunked(put_chunk, dirty_models, chunk_size,
+                                parallel)
+    if len(dirty_models) == len(models):
+      return results
+    results_by_model = {id(result.item): result for result in results}
+    return [results_by_model.get(id(model),
+                                 batch.BatchResult(model, model.key()))
+            for model in models]
+
+  @classmethod
+  def get_multi(cls, keys, parallel=True):
+    """
+        Gets the models for keys in chunks that fit the datastore
+        lookup limit. Returns a BatchResult per key, in order, whose
+        value is the model or None if the key does not exist.
+        Keys held by the caches are not fetched again.
+    """
+    client = cls.get_client()
+    unique_keys = list(dict.fromkeys(keys))
+    results_by_key = {}
+
+    cached = cls._cached_entities(unique_keys)
+    for key, entity in cached.items():
+      model = cls.from_entity(entity) if entity is not None else None
+      results_by_key[key] = batch.BatchResult(key, model)
+
+    def get_chunk(chunk):
+      found = {entity.key: entity for entity in client.get_multi(chunk)}
+      cls._record_lookup(chunk, found)
+      return [cls.from_entity(found[key]) if key in found else None
+              for key in chunk]
+
+    missed_keys = [key for key in unique_keys if key not in cached]
+    results = batch.run_chunked(get_chunk, missed_keys,
+                                constants.MAX_KEYS_PER_LOOKUP, parallel)
+    for result in results:
+      results_by_key[result.item] = result
+    return [results_by_key[key] for key in keys]
+
+  @classmethod
+  def delete_multi(cls, keys, parallel=False):
+    """
+        Deletes keys in chunks that fit the datastore mutation limit.
+        Returns a BatchResult per key.
+    """
     client = cls.get_client()
-    entity = client.get(key)
-    return cls(key=entity.key, entity=entity)
+
+    def delete_chunk(chunk):
+      if cls.__lookup_indexes__:
+        lookup_index.delete_keys(cls, chunk)
+        return
+      transactions.check_client(client)
+      client.delete_multi(chunk)
+      if not transactions.on_commit(cls._record_delete, chunk):
+        cls._record_delete(chunk)
+
+    chunk_size = constants.MAX_MUTATIONS_PER_COMMIT
+    if cls.__lookup_indexes__:
+      chunk_size = lookup_index.chunk_size(cls)
+    return batch.run_chunked(delete_chunk, keys, chunk_size, parallel)
+
+  @classmethod
+  def get_by(cls, name, value):
+    """
+        Returns the model whose property name has value, or None,
+        through the lookup index of the property. It costs two key
+        lookups that the caches usually serve. If several models have
+        a value that is not unique, the one indexed last is returned.
+    """
+    if name not in cls.__lookup_indexes__:
+      raise AttributeError(
+          "'{}' object has no lookup indexed property '{}'".format(
+              cls.__name__, name))
+    return lookup_index.get_by(cls, name, value)
 
   @classmethod
   def retrieve(cls, filters=None, order=None, limit=None, key_strs=None,
-               start_cursor=None):
+               start_cursor=None, skip_missing=False):
     """
-        The function to get the entity in cloud datastore
+        The function to get the entity in cloud datastore.
+        With key_strs the results follow the order of key_strs and
+        hold None for missing keys, unless skip_missing is set.
+        IN filters with more values than the datastore accepts are
+        split into queries that run in parallel and get merged.
     """
     if key_strs:
       # Special case to get a multi get
       keys = [cls.generate_key(key_str) for key_str in key_strs]
-      client = cls.get_client()
-      entities = client.get_multi(keys)
-      entity_list = [cls(key=entity.key, entity=entity) for entity in entities]
-      ordered_entity_list = []
-      for key in keys:
-        for entity in entity_list:
-          if entity.key() == key:
-            ordered_entity_list.append(entity)
-      return ordered_entity_list
+      ordered_models = []
+      for result in cls.get_multi(keys):
+        if not result.ok:
+          raise result.error
+        if result.value is not None or not skip_missing:
+          ordered_models.append(result.value)
+      return ordered_models
+
+    filter_lists = split_in_filters(filters or [])
+    if filter_lists is not None:
+      if start_cursor:
+        raise ValueError("Cursors are not supported when an IN filter "
+                         "is split into several queries")
+      result_lists = executor.run_all(
+          lambda sub_filters: cls._build_query(sub_filters, order).fetch(
+              limit=limit),
+          filter_lists)
+      return merge_results(result_lists, order, limit)
 
+    query = cls._build_query(filters, order)
+    entities = query.fetch(limit=limit, start_cursor=start_cursor or None)
+    return entities
+
+  @classmethod
+  def retrieve_async(cls, *args, **kwargs):
+    """
+        Runs retrieve on the shared rpc pool and returns a future,
+        so independent lookups can overlap. See executor.gather.
+    """
+    return executor.submit(cls.retrieve, *args, **kwargs)
+
+  @classmethod
+  def retrieve_page(cls, page_size, start_cursor=None, filters=None,
+                    order=None):
+    """
+        Fetches one page of results with a single rpc.
+        Returns a (results, next_cursor, more) tuple, see
+        Query.fetch_page.
+    """
+    query = cls._build_query(filters, order)
+    return query.fetch_page(page_size, start_cursor=start_cursor)
+
+  @classmethod
+  def _build_query(cls, filters=None, order=None):
     if not filters:
       filters = []
     query = Query(cls)
@@ -150,20 +643,95 @@ class Model():
 
     for filter in filters:
       query.add_filter(filter[0], filter[1], filter[2])
-
-    entities = query.fetch(limit=limit)
-    return entities
+    return query
 
   def delete(self):
     """
         The function to delete the entity from cloud datastore
     """
+    work = unit_of_work.get_current()
+    if work is not None and not transactions.in_transaction():
+      work.delete(type(self), self.__entity_key__)
+      return
+    if self.__lookup_indexes__:
+      lookup_index.delete_keys(type(self), [self.__entity_key__])
+      return
     client = self.get_client()
+    transactions.check_client(client)
     client.delete(self.__entity_key__)
+    keys = [self.__entity_key__]
+    if not transactions.on_commit(self._record_delete, keys):
+      self._record_delete(keys)
 
   def retrieved(self):
     return self.__retrieved__
 
+  def reference(self, name):
+    """
+        Returns the model the ReferenceProperty name points at, or
+        for a repeated property the list of them, with None for
+        entities that do not exist. Targets loaded by
+        prefetch_references are used as long as the property keeps its
+        value, otherwise they are fetched and kept on the model.
+    """
+    value = self.__entity__.get(name)
+    references = self.__references__
+    if references is not None and name in references:
+      loaded_value, targets = references[name]
+      if loaded_value == value:
+        return targets
+    reference_class = self._reference_property(name).reference_class
+    keys = value if isinstance(value, list) else [value]
+    found = {}
+    for result in reference_class.get_multi(
+        [key for key in keys if key is not None]):
+      if not result.ok:
+        raise result.error
+      found[result.item] = result.value
+    return self._attach_reference(name, value, found)
+
+  def _attach_reference(self, name, value, found):
+    if isinstance(value, list):
+      targets = [found.get(key) for key in value]
+      value = list(value)
+    else:
+      targets = found.get(value) if value is not None else None
+    if self.__references__ is None:
+      self.__references__ = {}
+    self.__references__[name] = (value, targets)
+    return targets
+
+  @classmethod
+  def _reference_property(cls, name):
+    prop = cls.__registry__.properties.get(name)
+    if not isinstance(prop, properties.ReferenceProperty):
+      raise AttributeError(
+          "'{}' object has no reference property '{}'".format(
+              cls.__name__, name))
+    if prop.reference_class is None:
+      raise ValueError("Reference property '{}' of '{}' has no "
+                       "reference_class".format(name, cls.__name__))
+    return prop
+
+  @classmethod
+  def prefetch_references(cls, models, fields):
+    """
+        Loads the models referenced by fields across all of models,
+        with one chunked get_multi per target class, and attaches them
+        so model.reference(field) costs no rpc. A field can be a path
+        like 'author.company' to also prefetch the references of the
+        loaded targets. Lookups go through the identity map and the
+        caches like get_multi. Returns models.
+    """
+    models = list(models)
+    paths = {}
+    for field in fields:
+      node = paths
+      for name in field.split('.'):
+        node = node.setdefault(name, {})
+    _prefetch(models, paths)
+    return models
+
   @classmethod
   def query(cls, **kwargs):
     """
@@ -172,13 +740,13 @@ class Model():
     return Query(cls, **kwargs)
 
   @classmethod
-  def get_client(self):
+  def get_client(cls):
     """
-        The method to get the datastore Client.
+        The method to get the datastore Client. A client set as
+        __client__ on the class is used over the shared one.
     """
-    if self.__client__ is None:
-      self.__client__ = datastore.Client(
-          namespace=helpers.get_datastore_namespace())
-    return self.__client__
+    if cls.__client__ is not None:
+      return cls.__client__
+    return clients.get_client()
 
 
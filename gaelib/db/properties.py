@@ -2,65 +2,201 @@
     This module defines the property classes for attributes.
 """
 from datetime import datetime
+from types import MappingProxyType
 from google.cloud.datastore.key import Key
 
 
 class Property():
   """
       The base property class for defining attribute types.
+      Properties are data descriptors, so reads and writes on a
+      model instance go straight to the underlying entity.
   """
   _repeated = None
   _default = None
   _choices = None
+  _indexed = True
+  _unique = False
+  _lookup_index = False
+  _name = None
 
-  def __init__(self, value, prop, repeated=None, default=None, choices=None):
+  def __init__(self, value, prop, repeated=None, default=None, choices=None,
+               indexed=None, unique=None, lookup_index=None):
     if repeated is not None:
       self._repeated = repeated
     if default is not None:
       self._default = default
     if choices is not None:
       self._choices = choices
+    if indexed is not None:
+      self._indexed = indexed
+    # Unique values are found through a lookup index too,
+    # see gaelib.db.lookup_index
+    if unique is not None:
+      self._unique = unique
+    if lookup_index is not None:
+      self._lookup_index = lookup_index
+    if self._unique:
+      self._lookup_index = True
+    if self._lookup_index and self._repeated:
+      raise ValueError("Repeated properties can not have a lookup index")
 
     self.property = prop
+    self._validator = self._compile_validator()
+    # Subclasses that override validate are always called through it
+    if type(self).validate is Property.validate:
+      self._validate = self._validator
+    else:
+      self._validate = self.validate
+    self._json_converter = self._compile_json_converter()
     self.value = self.validate(value)
 
+  def __set_name__(self, owner, name):
+    self._name = name
+
+  def __get__(self, instance, owner=None):
+    """
+        Returns the property itself on class access and the
+        stored entity value on instance access.
+    """
+    if instance is None:
+      return self
+    return instance.__entity__.get(self._name, None)
+
+  def __set__(self, instance, value):
+    """
+        Validates the value and writes it through to the entity.
+    """
+    instance._write_property(self._name, self._validate(value))
+
   def validate(self, value):
     """
         Method to validate the property value.
     """
-    valid = True
-    if self._repeated is True:
-      if isinstance(value, list):
-        for v in value:
-          valid = valid and isinstance(v, self.property)
+    return self._validator(value)
 
-      if not valid:
-        error_subject = "One repeated value"
+  def validate_many(self, values):
+    """
+        Validates a sequence of values, as when importing rows in
+        bulk, and returns the validated values in order.
+    """
+    validator = self._validate
+    return [validator(value) for value in values]
 
-    elif value and not isinstance(value, self.property):
-      valid = False
-      error_subject = "Value"
+  def _convert_json_value(self, value):
+    """
+        Converts a single non None value to a JSON safe one.
+        Returning None from _compile_json_converter instead, as the
+        base class does, means values are used as they are.
+    """
+    return value
 
-    if not value and self._default:
-      value = self._default
-      if not isinstance(value, self.property):
-        valid = False
-        error_subject = "Default value"
+  def _compile_json_converter(self):
+    """
+        Returns the function that converts stored values to JSON safe
+        ones, or None when they need no conversion.
+    """
+    if type(self)._convert_json_value is Property._convert_json_value:
+      return None
+    convert = self._convert_json_value
+    if self._repeated is True:
+      def convert_repeated(value):
+        if isinstance(value, list):
+          return [convert(item) if item is not None else None
+                  for item in value]
+        return convert(value)
+      return convert_repeated
+    return convert
 
-    choices = self._choices
+  def _compile_validator(self):
+    """
+        Builds a validator specialised for the configuration of the
+        property, so that validating a value only runs the checks that
+        can apply to it.
+    """
+    kind = self.property
+    repeated = self._repeated is True
     default = self._default
-    if choices and value and value not in choices:
-      raise ValueError("Value does not conform to the choices %s" % choices)
+    choices = self._choices
+
+    if not default and not choices:
+      if repeated:
+        def validate(value):
+          if isinstance(value, list):
+            for item in value:
+              if not isinstance(item, kind):
+                raise ValueError(
+                    "One repeated value {} doesn't match the class type "
+                    "for {}".format(str(value), kind))
+          return value
+      else:
+        def validate(value):
+          if value is None:
+            return None
+          if value and not isinstance(value, kind):
+            raise ValueError("Value {} doesn't match the class type "
+                             "for {}".format(str(value), kind))
+          return value
+      return validate
 
+    choice_set = None
+    if choices:
+      try:
+        choice_set = frozenset(choices)
+      except TypeError:
+        pass
+    choices_error = "Value does not conform to the choices %s" % choices
+    default_choices_error = None
     if choices and default and default not in choices:
-      raise ValueError(
+      default_choices_error = (
           "Default Value does not conform to the choices %s" % choices)
+    default_invalid = bool(default) and not isinstance(default, kind)
 
-    if not valid:
-      raise ValueError("{} {} doesn't match the class type for {}".format(
-          error_subject, str(value), self.property))
+    def validate(value):
+      error_subject = None
+      if repeated:
+        if isinstance(value, list):
+          for item in value:
+            if not isinstance(item, kind):
+              error_subject = "One repeated value"
+              break
+      elif value and not isinstance(value, kind):
+        error_subject = "Value"
 
-    return value
+      if not value and default:
+        value = default
+        if default_invalid:
+          error_subject = "Default value"
+
+      if choices and value:
+        try:
+          missing = value not in choice_set
+        except TypeError:
+          # Unhashable values or choices, compare one by one
+          missing = value not in choices
+        if missing:
+          raise ValueError(choices_error)
+      if default_choices_error:
+        raise ValueError(default_choices_error)
+
+      if error_subject:
+        raise ValueError("{} {} doesn't match the class type for {}".format(
+            error_subject, str(value), kind))
+      return value
+
+    # The outcome for None only depends on the configuration
+    try:
+      none_value, none_error = validate(None), None
+    except ValueError as e:
+      none_value, none_error = None, str(e)
+
+    def validate_with_none_path(value):
+      if value is None:
+        if none_error:
+          raise ValueError(none_error)
+        return none_value
+      return validate(value)
+    return validate_with_none_path
 
 
 class StringProperty(Property):
@@ -68,8 +204,11 @@ class StringProperty(Property):
       Attribute property class for string type
   """
 
-  def __init__(self, val=None, choices=None, default=None):
-    super().__init__(val, str, default=default, choices=choices)
+  def __init__(self, val=None, choices=None, default=None, indexed=None,
+               unique=None, lookup_index=None):
+    super().__init__(val, str, default=default, choices=choices,
+                     indexed=indexed, unique=unique,
+                     lookup_index=lookup_index)
 
 
 class FloatProperty(Property):
@@ -77,8 +216,8 @@ class FloatProperty(Property):
       Attribute property class for float type
   """
 
-  def __init__(self, value=None, repeated=None):
-    super().__init__(value, float, repeated)
+  def __init__(self, value=None, repeated=None, indexed=None):
+    super().__init__(value, float, repeated, indexed=indexed)
 
 
 class IntegerProperty(Property):
@@ -86,9 +225,12 @@ class IntegerProperty(Property):
       Attribute property class for int type
   """
 
-  def __init__(self, value=None, repeated=None, default=None, choices=None):
+  def __init__(self, value=None, repeated=None, default=None, choices=None,
+               indexed=None, unique=None, lookup_index=None):
     # choices is used when you want to have an enum
-    super().__init__(value, int, repeated, default=default, choices=choices)
+    super().__init__(value, int, repeated, default=default, choices=choices,
+                     indexed=indexed, unique=unique,
+                     lookup_index=lookup_index)
 
 
 class BooleanProperty(Property):
@@ -96,8 +238,8 @@ class BooleanProperty(Property):
       Attribute property class for int type
   """
 
-  def __init__(self, value=None, repeated=None):
-    super().__init__(value, bool, repeated)
+  def __init__(self, value=None, repeated=None, indexed=None):
+    super().__init__(value, bool, repeated, indexed=indexed)
 
 
 class DateTimeProperty(Property):
@@ -105,8 +247,11 @@ class DateTimeProperty(Property):
       Attribute property class for datetime type
   """
 
-  def __init__(self, value=None, repeated=None):
-    super().__init__(value, datetime, repeated)
+  def __init__(self, value=None, repeated=None, indexed=None):
+    super().__init__(value, datetime, repeated, indexed=indexed)
+
+  def _convert_json_value(self, value):
+    return value.isoformat()
 
 
 class ReferenceProperty(Property):
@@ -114,6 +259,50 @@ class ReferenceProperty(Property):
       Attribute property class for datastore key type.
   """
 
-  def __init__(self,  value=None, reference_class=None, repeated=None):
+  def __init__(self,  value=None, reference_class=None, repeated=None,
+               indexed=None):
     self.reference_class = reference_class
-    super().__init__(value, Key, repeated)
+    super().__init__(value, Key, repeated, indexed=indexed)
+
+  def _convert_json_value(self, value):
+    return value.to_legacy_urlsafe().decode('ascii')
+
+
+class PropertyRegistry():
+  """
+      Immutable lookup tables for the properties of a model class.
+      Built once when the class is created so that instance creation
+      and updates never have to inspect the class again.
+  """
+  __slots__ = ('properties', 'defaults', 'validators', 'unindexed',
+               'json_plan', 'lookup_indexes')
+
+  def __init__(self, properties_map):
+    object.__setattr__(self, 'properties', MappingProxyType(
+        dict(properties_map)))
+    object.__setattr__(self, 'defaults', MappingProxyType(
+        {name: prop._default for name, prop in properties_map.items()
+         if prop._default is not None}))
+    object.__setattr__(self, 'validators', MappingProxyType(
+        {name: prop._validate for name, prop in properties_map.items()}))
+    # Entity expects a list or tuple for exclude_from_indexes
+    object.__setattr__(self, 'unindexed', tuple(
+        name for name, prop in properties_map.items() if not prop._indexed))
+    # (name, converter) pairs used to serialize models to JSON
+    object.__setattr__(self, 'json_plan', tuple(
+        (name, prop._json_converter)
+        for name, prop in properties_map.items()))
+    object.__setattr__(self, 'lookup_indexes', tuple(
+        name for name, prop in properties_map.items() if prop._lookup_index))
+
+  def __setattr__(self, name, value):
+    raise AttributeError("PropertyRegistry is immutable")
+
+  def __delattr__(self, name):
+    raise AttributeError("PropertyRegistry is immutable")
+
+  def __contains__(self, name):
+    return name in self.properties
+
+  def __iter__(self):
+    return iter(self.properties)
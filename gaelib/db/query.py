@@ -2,7 +2,132 @@
     This module defines a base Query class to create
     datastore query objects and perform queries on datastore.
 """
-from google.cloud import datastore
+import itertools
+import threading
+
+from . import constants, executor, helpers, query_cache, transactions
+
+_record_classes = {}
+_record_classes_lock = threading.Lock()
+
+
+class Record():
+  """
+      A compact, read-only result of a projection query.
+      Subclasses are generated per projection with a slot per field.
+  """
+  __slots__ = ()
+  _fields = ()
+
+  def __init__(self, key, entity):
+    object.__setattr__(self, 'key', key)
+    for field in self._fields:
+      object.__setattr__(self, field, entity.get(field))
+
+  def __setattr__(self, name, value):
+    raise AttributeError("Projection records are read-only")
+
+  def __delattr__(self, name):
+    raise AttributeError("Projection records are read-only")
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self._values() == other._values()
+
+  def __hash__(self):
+    return hash(self._values())
+
+  def __repr__(self):
+    fields = ', '.join('{}={!r}'.format(field, getattr(self, field))
+                       for field in self._fields)
+    return '<{} {}>'.format(type(self).__name__, fields)
+
+  def _values(self):
+    return (self.key,) + tuple(getattr(self, field) for field in self._fields)
+
+  def to_dict(self):
+    return {field: getattr(self, field) for field in self._fields}
+
+
+def record_class(kind, fields):
+  """
+      Returns the Record subclass for a projection of fields on kind.
+  """
+  fields = tuple(fields)
+  class_key = (kind, fields)
+  cls = _record_classes.get(class_key)
+  if cls is None:
+    with _record_classes_lock:
+      cls = _record_classes.get(class_key)
+      if cls is None:
+        cls = type(kind + 'Record', (Record,),
+                   {'__slots__': ('key',) + fields, '_fields': fields})
+        _record_classes[class_key] = cls
+  return cls
+
+
+def encode_cursor(cursor):
+  """
+      Returns a cursor as a URL-safe string. Datastore cursors are
+      already base64 URL-safe encoded bytes.
+  """
+  if isinstance(cursor, bytes):
+    return cursor.decode('ascii')
+  return cursor
+
+
+def split_in_filters(filters):
+  """
+      Splits every IN filter with more values than the backend accepts
+      into chunks. Returns one filter list per combination of chunks,
+      or None when the filters can be run as a single query.
+  """
+  filters = list(filters)
+  split = False
+  options = []
+  for filter in filters:
+    attribute, op, values = filter[0], filter[1], filter[2]
+    if op.upper() == 'IN' and len(values) > constants.MAX_IN_FILTER_VALUES:
+      split = True
+      options.append([(attribute, op, chunk) for chunk in helpers.chunks(
+          list(values), constants.MAX_IN_FILTER_VALUES)])
+    else:
+      options.append([filter])
+  if not split:
+    return None
+  return [list(combination) for combination in itertools.product(*options)]
+
+
+def merge_results(result_lists, order=None, limit=None):
+  """
+      Merges the models of several queries, dropping repeated keys
+      and sorting by order the way the datastore would.
+  """
+  merged = []
+  seen = set()
+  for results in result_lists:
+    for result in results:
+      if result.key() not in seen:
+        seen.add(result.key())
+        merged.append(result)
+
+  if isinstance(order, str):
+    order = [order]
+  # Stable sorts from the least significant field onwards, after the
+  # key order the datastore falls back to
+  merged.sort(key=lambda model: helpers.key_path(model.key()))
+  for field in reversed(order or []):
+    descending = field.startswith('-')
+    field = field.lstrip('-')
+    if field == '__key__':
+      merged.sort(key=lambda model: helpers.key_path(model.key()),
+                  reverse=descending)
+    else:
+      merged.sort(key=lambda model: helpers.order_value(
+          model.__entity__.get(field), descending), reverse=descending)
+
+  if limit is not None:
+    merged = merged[:limit]
+  return merged
 
 
 class Query():
@@ -13,6 +138,10 @@ class Query():
 
   def __init__(self, model_class, **kwargs):
     self.__model_class__ = model_class
+    self.__record_class__ = None
+    self.__keys_only__ = False
+    self.__prefetch__ = ()
+    self.cursor = None
     self.__query__ = model_class.get_client().query(
         kind=self.__model_class__.__name__, **kwargs)
 
@@ -25,12 +154,163 @@ class Query():
   def assign_order(self, order):
     self.__query__.order = order
 
+  def keys_only(self):
+    """
+        Makes the query return datastore keys instead of models.
+    """
+    self.__query__.keys_only()
+    self.__keys_only__ = True
+    return self
+
+  def project(self, *fields):
+    """
+        Makes the query a projection on fields that returns read-only
+        Records instead of models. Only entities with an indexed value
+        for every field are returned, and projecting more than one
+        field needs a composite index in production.
+    """
+    self.__query__.projection = list(fields)
+    self.__record_class__ = record_class(self.__model_class__.__name__,
+                                         fields)
+    return self
+
+  def prefetch(self, *fields):
+    """
+        Makes the query load the models referenced by fields with
+        every page of results, see Model.prefetch_references.
+    """
+    if self.__keys_only__ or self.__record_class__ is not None:
+      raise ValueError("References can only be prefetched for queries "
+                       "that return models")
+    self.__prefetch__ = self.__prefetch__ + fields
+    return self
+
   def fetch(self, **kwargs):
     """
         The method to fetch and return query results.
+        Served from the query cache for models that opt in.
+    """
+    shape = self._cache_shape('fetch', kwargs)
+    if shape is None:
+      return self._build_models(self.__query__.fetch(**kwargs))
+    entities, _ = query_cache.fetch(
+        self.__model_class__, query_cache.kind_key(self.__query__), shape,
+        lambda: (self.__query__.fetch(**kwargs), None))
+    return self._build_models(entities)
+
+  def fetch_async(self, **kwargs):
+    """
+        Runs fetch on the shared rpc pool and returns a future.
+    """
+    return executor.submit(self.fetch, **kwargs)
+
+  def fetch_page(self, page_size, start_cursor=None):
+    """
+        Fetches a single page of results with one rpc. Returns a
+        (results, next_cursor, more) tuple where next_cursor is a
+        URL-safe string to pass back as start_cursor. As with the
+        datastore itself, more can be True with an empty next page.
+    """
+    def load():
+      iterator = self.__query__.fetch(limit=page_size,
+                                      start_cursor=start_cursor or None)
+      page = next(iterator.pages, [])
+      return list(page), encode_cursor(iterator.next_page_token)
+
+    shape = self._cache_shape('fetch_page', {'limit': page_size,
+                                             'start_cursor': start_cursor})
+    if shape is None:
+      page, next_cursor = load()
+    else:
+      page, next_cursor = query_cache.fetch(
+          self.__model_class__, query_cache.kind_key(self.__query__),
+          shape, load)
+    results = self._build_models(page)
+    self.cursor = next_cursor
+    return results, next_cursor, next_cursor is not None
+
+  def _cache_shape(self, method, kwargs):
+    """
+        Returns the normalized shape of the query and its fetch
+        arguments, or None when the model does not use the query cache.
     """
-    results = []
-    for obj in list((self.__query__.fetch(**kwargs))):
-      result_obj = self.__model_class__(key=obj.key, entity=obj)
-      results.append(result_obj)
-    return results
+    if (not self.__model_class__.__query_cache__ or
+        transactions.in_transaction()):
+      return None
+    query = self.__query__
+    arguments = dict(kwargs)
+    if arguments.get('start_cursor'):
+      arguments['start_cursor'] = encode_cursor(arguments['start_cursor'])
+    else:
+      arguments.pop('start_cursor', None)
+    filters = sorted((query_cache.freeze(filter) for filter in query.filters),
+                     key=repr)
+    ancestor = None
+    if query.ancestor is not None:
+      ancestor = (query.ancestor.namespace, query.ancestor.flat_path)
+    return (method, tuple(filters), ancestor, tuple(query.order),
+            tuple(query.projection), tuple(query.distinct_on),
+            self.__keys_only__, query_cache.freeze(arguments))
+
+  def _build_models(self, entities):
+    if self.__keys_only__:
+      return [obj.key for obj in entities]
+    if self.__record_class__ is not None:
+      return [self.__record_class__(obj.key, obj) for obj in entities]
+
+    # Query results stay out of the identity map, which would keep a
+    # copy of every entity of large fetches until the request ends
+    models = self.__model_class__.from_entities(entities)
+    if self.__prefetch__:
+      self.__model_class__.prefetch_references(models, self.__prefetch__)
+    return models
+
+  def _build_result(self, obj):
+    if self.__keys_only__:
+      return obj.key
+    if self.__record_class__ is not None:
+      return self.__record_class__(obj.key, obj)
+    return self.__model_class__.from_entity(obj)
+
+  def iter(self, page_size=constants.QUERY_PAGE_SIZE, limit=None,
+           start_cursor=None):
+    """
+        Generator over the query results that fetches one page of
+        page_size entities per rpc and builds each model only when
+        it is reached, so memory use does not grow with the result
+        set. While a page is being iterated self.cursor holds the
+        cursor to the start of that page, so resuming from it never
+        skips results.
+    """
+    self.cursor = start_cursor or None
+    remaining = limit
+    while remaining is None or remaining > 0:
+      fetch_limit = page_size if remaining is None else min(page_size,
+                                                            remaining)
+      iterator = self.__query__.fetch(limit=fetch_limit,
+                                      start_cursor=self.cursor)
+      page = next(iterator.pages, None)
+      if page is None:
+        return
+
+      if self.__prefetch__:
+        # The references of a page are loaded together
+        page = self.__model_class__.prefetch_references(
+            self.__model_class__.from_entities(list(page)),
+            self.__prefetch__)
+      else:
+        page = (self._build_result(obj) for obj in page)
+
+      count = 0
+      for result in page:
+        count += 1
+        yield result
+
+      if remaining is not None:
+        remaining -= count
+      # A page can come back empty before the end of the results, as
+      # when filters skip many entities, so only the cursor tells
+      cursor = encode_cursor(iterator.next_page_token)
+      if cursor is None or (not count and cursor == self.cursor):
+        return
+      self.cursor = cursor
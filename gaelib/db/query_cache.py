@@ -0,0 +1,125 @@
+"""
+    This module defines the query result cache used by models that
+    opt in with __query_cache__ = True. Results are keyed by the shape
+    of the query, and every write gaelib makes to a kind in this
+    process moves the kind to a new generation, dropping its results.
+    Writes from other processes are only picked up once the per-kind
+    ttl expires.
+"""
+import threading
+import time
+
+import cachetools
+
+from . import helpers, instrumentation
+
+_caches = {}
+_generations = {}
+_hits = 0
+_misses = 0
+_lock = threading.Lock()
+_timer = time.monotonic
+
+
+def _now():
+  return _timer()
+
+
+def freeze(value):
+  """
+      Returns a hashable form of a filter, order or argument value.
+  """
+  if isinstance(value, (list, tuple)):
+    return tuple(freeze(item) for item in value)
+  if isinstance(value, dict):
+    return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+  return value
+
+
+def kind_key(key):
+  """
+      Returns the (project, namespace, kind) a datastore key or
+      query belongs to.
+  """
+  return (key.project, key.namespace, key.kind)
+
+
+def bump_generation(kind_keys):
+  """
+      Moves every kind in kind_keys to a new generation, so results
+      cached for it are no longer served.
+  """
+  with _lock:
+    for kind in kind_keys:
+      _generations[kind] = _generations.get(kind, 0) + 1
+      _caches.pop(kind, None)
+
+
+def fetch(model_class, kind, shape, loader):
+  """
+      Returns the (entities, extra) payload cached for shape, calling
+      loader to build and cache it on a miss. Results are only cached
+      when the kind was not written to while loader ran.
+  """
+  global _hits, _misses
+  with _lock:
+    generation = _generations.get(kind, 0)
+    cache = _caches.get(kind)
+    value = cache.get(shape) if cache is not None else None
+    if value is not None:
+      _hits += 1
+    else:
+      _misses += 1
+
+  if value is not None:
+    entities, extra = value[2]
+    return [helpers.copy_entity(entity) for entity in entities], extra
+
+  entities, extra = loader()
+  entities = list(entities)
+  copies = tuple(helpers.copy_entity(entity) for entity in entities)
+  size = sum(instrumentation.entity_size(entity) for entity in copies)
+  with _lock:
+    if _generations.get(kind, 0) == generation:
+      cache = _caches.get(kind)
+      if cache is None:
+        # Values are (ttl, size, payload) so both vary per kind
+        cache = cachetools.TLRUCache(
+            maxsize=model_class.__query_cache_size__,
+            ttu=lambda _key, value, now: now + value[0],
+            timer=_now, getsizeof=lambda value: max(1, value[1]))
+        _caches[kind] = cache
+      try:
+        cache[shape] = (model_class.__query_cache_ttl__, size,
+                        (copies, extra))
+      except ValueError:
+        # The result alone is larger than the kind's memory limit
+        pass
+  return entities, extra
+
+
+def stats():
+  """
+      Returns the hits, misses, hit rate, entries and bytes held
+      by the cache, for monitoring.
+  """
+  with _lock:
+    lookups = _hits + _misses
+    return {
+        'hits': _hits,
+        'misses': _misses,
+        'hit_rate': _hits / lookups if lookups else 0.0,
+        'entries': sum(len(cache) for cache in _caches.values()),
+        'bytes': sum(cache.currsize for cache in _caches.values()),
+    }
+
+
+def clear():
+  """
+      Drops every cached result and resets the statistics.
+  """
+  global _hits, _misses
+  with _lock:
+    _caches.clear()
+    _hits = 0
+    _misses = 0
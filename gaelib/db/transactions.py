@@ -0,0 +1,187 @@
+"""
+    This module defines datastore transactions. Functions decorated
+    with transactional are retried with exponential backoff and jitter
+    when the datastore aborts them because of contention.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from google.api_core import exceptions
+
+from . import clients, constants
+
+# Errors the datastore raises when a transaction lost a contention race
+RETRY_ERRORS = (exceptions.Aborted, exceptions.Conflict)
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('gaelib_transaction', default=None)
+_sleep = time.sleep
+_stats_lock = threading.Lock()
+_stats = {'commits': 0, 'retries': 0, 'failures': 0}
+_retries_by_name = {}
+
+
+class TransactionState():
+  """
+      The running datastore transaction, the client it runs on and the
+      callbacks to run once it commits, which keep the caches from
+      seeing uncommitted writes.
+  """
+
+  def __init__(self, client, transaction):
+    self.client = client
+    self.transaction = transaction
+    self.on_commit = []
+
+
+def get_current():
+  """
+      Returns the state of the transaction running in this context,
+      or None.
+  """
+  return _current.get()
+
+
+def in_transaction():
+  return _current.get() is not None
+
+
+def check_client(client):
+  """
+      Raises a ValueError when the current transaction runs on another
+      client than client, as it would neither commit nor roll back
+      the writes made with client.
+  """
+  state = _current.get()
+  if state is not None and state.client is not client:
+    raise ValueError("The current transaction runs on another datastore "
+                     "client, pass the model's client to transaction()")
+
+
+def on_commit(fn, *args):
+  """
+      Defers fn until the current transaction commits. Returns False,
+      without calling fn, when there is no transaction.
+  """
+  state = _current.get()
+  if state is None:
+    return False
+  state.on_commit.append((fn, args))
+  return True
+
+
+@contextlib.contextmanager
+def transaction(read_only=False, client=None):
+  """
+      Runs the block in a datastore transaction that commits when it
+      exits without an error. The block is run once, use transactional
+      to retry on contention. A nested block joins the outer
+      transaction. Models with their own __client__ have to pass it
+      as client, the shared client is used otherwise.
+  """
+  state = _current.get()
+  if state is not None:
+    if client is not None:
+      check_client(client)
+    yield state.transaction
+    return
+
+  if client is None:
+    client = clients.get_client()
+  state = TransactionState(client, client.transaction(read_only=read_only))
+  token = _current.set(state)
+  try:
+    with state.transaction:
+      yield state.transaction
+  finally:
+    _current.reset(token)
+
+  with _stats_lock:
+    _stats['commits'] += 1
+  for fn, args in state.on_commit:
+    fn(*args)
+
+
+def _backoff(attempt):
+  delay = min(constants.TRANSACTION_MAX_DELAY,
+              constants.TRANSACTION_BASE_DELAY * 2 ** attempt)
+  # Full jitter keeps contending clients from retrying in lockstep
+  return random.uniform(0, delay)
+
+
+def run_in_transaction(fn, *args, attempts=None, read_only=False, name=None,
+                       client=None, **kwargs):
+  """
+      Calls fn in a transaction, on client if given, and returns its
+      result. When the datastore aborts the transaction fn is called again, up to
+      attempts times in all, before the error is raised.
+  """
+  if _current.get() is not None:
+    if client is not None:
+      check_client(client)
+    return fn(*args, **kwargs)
+
+  if attempts is None:
+    attempts = constants.TRANSACTION_ATTEMPTS
+  if name is None:
+    name = getattr(fn, '__qualname__', repr(fn))
+
+  for attempt in range(attempts):
+    try:
+      with transaction(read_only=read_only, client=client):
+        return fn(*args, **kwargs)
+    except RETRY_ERRORS as e:
+      if attempt + 1 >= attempts:
+        with _stats_lock:
+          _stats['failures'] += 1
+        logger.warning("Transaction %s failed after %d attempts: %s",
+                       name, attempts, e)
+        raise
+      with _stats_lock:
+        _stats['retries'] += 1
+        _retries_by_name[name] = _retries_by_name.get(name, 0) + 1
+      logger.info("Retrying transaction %s after contention: %s", name, e)
+      _sleep(_backoff(attempt))
+
+
+def transactional(fn=None, attempts=None, read_only=False, client=None):
+  """
+      Decorator that runs the function with run_in_transaction.
+      Can be used bare or with attempts, read_only and client.
+  """
+  def decorator(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      return run_in_transaction(fn, *args, attempts=attempts,
+                                read_only=read_only,
+                                name=fn.__qualname__, client=client,
+                                **kwargs)
+    return wrapper
+
+  if fn is not None:
+    return decorator(fn)
+  return decorator
+
+
+def stats():
+  """
+      Returns the commit, retry and failure counts, with the retries
+      per transaction name to point at contended entity groups.
+  """
+  with _stats_lock:
+    result = dict(_stats)
+    result['retries_by_name'] = dict(_retries_by_name)
+  return result
+
+
+def clear_stats():
+  with _stats_lock:
+    for name in _stats:
+      _stats[name] = 0
+    _retries_by_name.clear()
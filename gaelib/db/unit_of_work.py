@@ -0,0 +1,124 @@
+"""
+    This module defines the unit of work that holds back the puts and
+    deletes made inside it and sends them together, in as few rpcs as
+    the datastore limits allow, when it ends.
+"""
+import contextlib
+import contextvars
+import threading
+
+from . import helpers
+
+_current = contextvars.ContextVar('gaelib_unit_of_work', default=None)
+
+
+class UnitOfWork():
+  """
+      Pending writes keyed by entity key, so only the last put or
+      delete of a key is sent. Models are held by reference, and
+      their state at flush time is what gets written.
+  """
+
+  def __init__(self):
+    self._puts = {}
+    self._deletes = {}
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._puts) + len(self._deletes)
+
+  def put(self, model):
+    key = model.key()
+    with self._lock:
+      if key.is_partial:
+        # Incomplete keys can not clash, the datastore completes them
+        self._puts[id(model)] = model
+      else:
+        self._deletes.pop(key, None)
+        self._puts[key] = model
+
+  def delete(self, model_class, key):
+    with self._lock:
+      self._puts.pop(key, None)
+      self._deletes[key] = model_class
+
+  def get(self, key):
+    """
+        Returns a (hit, entity) tuple for a pending write of key,
+        where entity is None for a pending delete.
+    """
+    with self._lock:
+      if key in self._deletes:
+        return True, None
+      model = self._puts.get(key)
+    if model is None:
+      return False, None
+    return True, helpers.copy_entity(model.__entity__)
+
+  def flush(self):
+    """
+        Sends the pending writes with one put_multi and one
+        delete_multi per model class, then raises the first error
+        of any chunk that failed.
+    """
+    with self._lock:
+      puts = list(self._puts.values())
+      deletes = list(self._deletes.items())
+      self._puts = {}
+      self._deletes = {}
+
+    models_by_class = {}
+    for model in puts:
+      models_by_class.setdefault(type(model), []).append(model)
+    keys_by_class = {}
+    for key, model_class in deletes:
+      keys_by_class.setdefault(model_class, []).append(key)
+
+    results = []
+    for model_class, models in models_by_class.items():
+      results.extend(model_class.put_multi(models, force=True))
+    for model_class, keys in keys_by_class.items():
+      results.extend(model_class.delete_multi(keys))
+    for result in results:
+      if not result.ok:
+        raise result.error
+
+
+def get_current():
+  """
+      Returns the unit of work writes are currently deferred to,
+      or None.
+  """
+  return _current.get()
+
+
+def flush():
+  """
+      Sends the writes pending in the current unit of work, if any.
+  """
+  work = _current.get()
+  if work is not None:
+    work.flush()
+
+
+@contextlib.contextmanager
+def batched_writes():
+  """
+      Defers the puts and deletes made inside the block, or inside
+      the decorated view, and flushes them when it exits without an
+      error. Lookups by key see the pending writes, queries do not.
+      A nested block joins the outer one.
+  """
+  work = _current.get()
+  if work is not None:
+    yield work
+    return
+
+  work = UnitOfWork()
+  token = _current.set(work)
+  try:
+    yield work
+  finally:
+    _current.reset(token)
+  work.flush()
@@ -1,2 +1,8 @@
+import os
+
+# Without an emulator to talk to the tests use the in-memory backend
+if not os.getenv('DATASTORE_EMULATOR_HOST'):
+  os.environ.setdefault('DATASTORE_BACKEND', 'memory')
+
 from . import cron
 from . import db
\ No newline at end of file
@@ -1,7 +1,8 @@
 from gaelib.tests.auth.base import BaseAuthUnitTestCase
 from gaelib.auth.decorators import auth_required, verification_required, get_login_user, access_control
 from gaelib.auth.models import User, UserRole
-from mock import Mock
+from flask import g
+from mock import Mock, patch
 import json
 
 
@@ -205,6 +206,19 @@ class DecoratorsTestCase(BaseAuthUnitTestCase):
       response = get_login_user()
       self.assertEqual(user1.key().id, response.key().id)
 
+  def test_login_user_when_authenticated_user_key_is_set(self):
+    self.get_auth_type.return_value = 'firebase'
+    self.get_user_id_and_token.return_value = ('id_2', None)
+    with self.app_for_test.test_request_context():
+      user = User(uid='id_1', token='token_1')
+      user.put()
+      self.app_for_test.preprocess_request()
+      g.user_key = user.key().id
+      with patch('gaelib.db.query.Query.fetch') as fetch:
+        response = get_login_user()
+      fetch.assert_not_called()
+      self.assertEqual(user.key().id, response.key().id)
+
   def test_access_control_when_user_is_staff_member_and_auth_type_is_firebase(self):
     self.get_auth_type.return_value = 'firebase'
     self.get_user_id_and_token.return_value = ('id_1', None)
@@ -312,3 +326,37 @@ class DecoratorsTestCase(BaseAuthUnitTestCase):
       data = json.loads(response[0].get_data(as_text=True))
       self.assertEqual('UNAUTHORIZED ACCESS',
                         data['error_message'])
+
+  def test_login_user_is_found_without_a_query(self):
+    self.get_auth_type.return_value = 'firebase'
+    self.get_user_id_and_token.return_value = ('id_1', None)
+    self.get_user_token.return_value = ('token_1')
+    with self.app_for_test.test_request_context():
+      user = User(uid='id_1', token='token_1')
+      user.put()
+      with patch.object(User, 'query') as query:
+        self.assertEqual(get_login_user().key(), user.key())
+        self.get_auth_type.return_value = 'verify'
+        self.assertEqual(get_login_user().key(), user.key())
+      query.assert_not_called()
+
+  def test_access_control_sees_role_changes_made_elsewhere(self):
+    self.get_auth_type.return_value = 'firebase'
+    self.get_user_id_and_token.return_value = ('id_1', None)
+    decorated_func = access_control(role=UserRole.STAFF)(Mock(return_value="OK"))
+    with self.app_for_test.test_request_context():
+      self.app_for_test.preprocess_request()
+      self.add_user_entity(role=1, uid='id_1')
+      self.assertEqual("OK", decorated_func())
+
+    # Lowered by another instance, whose writes this process never sees
+    client = User.get_client()
+    entity = list(client.query(kind='User').fetch())[0]
+    entity['role'] = UserRole.DEFAULT.value
+    client.put(entity)
+
+    with self.app_for_test.test_request_context():
+      self.app_for_test.preprocess_request()
+      response = decorated_func()
+      data = json.loads(response[0].get_data(as_text=True))
+      self.assertEqual('UNAUTHORIZED ACCESS', data['error_message'])
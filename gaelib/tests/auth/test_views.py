@@ -3,6 +3,7 @@ from gaelib.auth.models import User
 from gaelib.auth import views
 from flask import g
 import base64
+from mock import patch
 import json
 
 class LoginViewTestCase(BaseAuthUnitTestCase):
@@ -687,6 +688,38 @@ class ViewsTestCase(BaseAuthUnitTestCase):
       self.assertEqual('user_id', user_resp.uid)
       self.assertEqual('user', user_resp.name)
 
+  def test_check_for_new_user_when_existing_user_has_no_email_claim(self):
+    with self.app_for_test.test_request_context():
+      self.app_for_test.preprocess_request()
+      user = self.add_user_entity(uid='user_id')
+      with patch.object(User, 'get_by', wraps=User.get_by) as get_by:
+        user_resp = views.check_for_new_user_with_uid(g.app.logger, 'user_id', {'name': 'user', 'sub': 'user_id'}, None)
+      get_by.assert_called_once_with('uid', 'user_id')
+      self.assertEqual(user.key().id, user_resp.key().id)
+      self.assertEqual(1, self.get_entity_count('User'))
+
+  def test_check_for_new_user_does_not_create_user_when_lookup_fails(self):
+    with self.app_for_test.test_request_context():
+      self.app_for_test.preprocess_request()
+      with patch.object(User, 'get_by', side_effect=RuntimeError('unavailable')):
+        with self.assertRaises(RuntimeError):
+          views.check_for_new_user_with_uid(g.app.logger, 'user_id', {'name': 'user', 'email': 'user@cc'}, None)
+        with self.assertRaises(RuntimeError):
+          views.check_for_new_user_with_phone_or_email(g.app.logger, '1234', None, None)
+      self.assertEqual(0, self.get_entity_count('User'))
+
+  def test_check_for_new_user_does_not_write_unchanged_user(self):
+    claims = {'name': 'user', 'email': 'user@cc'}
+    with self.app_for_test.test_request_context():
+      self.app_for_test.preprocess_request()
+      self.add_user_entity(uid='user_id')
+      views.check_for_new_user_with_uid(g.app.logger, 'user_id', claims, None)
+      client = User.get_client()
+      with patch.object(client, 'put', wraps=client.put) as put:
+        user = views.check_for_new_user_with_uid(g.app.logger, 'user_id', claims, None)
+      put.assert_not_called()
+      self.assertEqual('user', user.name)
+
   def test_check_for_new_user_if_device_token_updated_when_existing_user(self):
     device_token_data = {
       'token': 'test_token',
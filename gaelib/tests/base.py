@@ -2,9 +2,8 @@ import unittest
 from requests.auth import _basic_auth_str
 
 from gaelib.auth.models import User
-from gaelib.db import helpers
+from gaelib.db import cache, clients, memory, query_cache
 from gaelib.utils import web
-from google.cloud import datastore
 from mock import patch
 
 
@@ -26,7 +25,12 @@ class BaseUnitTestCase(unittest.TestCase):
     # Nosetests use a different database and it also does not use namespace from app.yaml,
     # so for now, we need to use the default namespace,
     # we will change this stuff later after further research.
-    client = datastore.Client(namespace=helpers.get_datastore_namespace())
+    cache.get_backend().clear()
+    query_cache.clear()
+    client = clients.get_client()
+    if isinstance(client, memory.MemoryClient):
+      client.store.clear()
+      return
     query = client.query(kind='__kind__')
     query.keys_only()
     kinds = [entity.key.id_or_name for entity in query.fetch()]
@@ -39,7 +43,7 @@ class BaseUnitTestCase(unittest.TestCase):
         client.delete_multi(keys[i:i + 499])
 
   def get_entity_count(self, kind):
-    client = datastore.Client(namespace=helpers.get_datastore_namespace())
+    client = clients.get_client()
     query = client.query(kind=kind)
     query.keys_only()
     keys = [entity.key for entity in query.fetch()]
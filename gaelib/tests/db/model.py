@@ -9,3 +9,61 @@ class SampleModel(model.Model):
     int1 = properties.IntegerProperty()
     float1 = properties.FloatProperty()
     bool1 = properties.BooleanProperty()
+
+
+class DefaultsSampleModel(model.Model):
+    """
+        Test database with defaults and unindexed properties
+    """
+    string1 = properties.StringProperty(default='default1')
+    int1 = properties.IntegerProperty(default=1, choices=[1, 2])
+    notes = properties.StringProperty(indexed=False)
+
+
+class CachedSampleModel(model.Model):
+    """
+        Test database using the process cache
+    """
+    __cache__ = True
+    __cache_ttl__ = 30
+
+    string1 = properties.StringProperty()
+
+
+class QueryCachedSampleModel(model.Model):
+    """
+        Test database using the query result cache
+    """
+    __query_cache__ = True
+    __query_cache_ttl__ = 30
+
+    string1 = properties.StringProperty()
+    int1 = properties.IntegerProperty()
+
+
+class SerializedSampleModel(model.Model):
+    """
+        Test database with properties that need converting to JSON
+    """
+    string1 = properties.StringProperty()
+    date1 = properties.DateTimeProperty()
+    reference1 = properties.ReferenceProperty(reference_class=SampleModel)
+    references = properties.ReferenceProperty(reference_class=SampleModel, repeated=True)
+
+
+class NestedReferenceSampleModel(model.Model):
+    """
+        Test database referencing a model with references
+    """
+    parent = properties.ReferenceProperty(reference_class=SerializedSampleModel)
+    string1 = properties.StringProperty()
+
+
+class LookupSampleModel(model.Model):
+    """
+        Test database with lookup indexed properties
+    """
+    email = properties.StringProperty(lookup_index=True)
+    handle = properties.StringProperty(unique=True)
+    number = properties.IntegerProperty(lookup_index=True)
+    string1 = properties.StringProperty()
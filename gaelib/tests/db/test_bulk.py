@@ -0,0 +1,82 @@
+"""
+    This module defines the testcases for the bulk Model operations.
+"""
+from mock import patch
+
+from gaelib import db
+from gaelib.db import constants
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import SampleModel
+
+
+class BulkOperationsTestCase(BaseUnitTestCase):
+
+  def create_models(self, count):
+    return [SampleModel(key_str='bulk{}'.format(i), int1=i)
+            for i in range(count)]
+
+  def test_put_multi_is_chunked(self):
+    models = self.create_models(7)
+    client = SampleModel.get_client()
+    with patch.object(constants, 'MAX_MUTATIONS_PER_COMMIT', 3), \
+            patch.object(client, 'put_multi', wraps=client.put_multi) as put_multi:
+      results = SampleModel.put_multi(models)
+    self.assertEqual(put_multi.call_count, 3)
+    self.assertTrue(all(result.ok for result in results))
+    self.assertEqual([result.value for result in results],
+                     [model.key() for model in models])
+    self.assertEqual(self.get_entity_count('SampleModel'), 7)
+
+  def test_put_multi_reports_failed_chunks(self):
+    models = self.create_models(5)
+    client = SampleModel.get_client()
+    put_multi = client.put_multi
+    calls = []
+
+    def fail_second_chunk(entities):
+      calls.append(entities)
+      if len(calls) == 2:
+        raise RuntimeError('commit failed')
+      return put_multi(entities)
+
+    with patch.object(constants, 'MAX_MUTATIONS_PER_COMMIT', 2), \
+            patch.object(client, 'put_multi', side_effect=fail_second_chunk):
+      results = SampleModel.put_multi(models)
+
+    self.assertEqual([result.ok for result in results],
+                     [True, True, False, False, True])
+    self.assertIsInstance(results[2].error, RuntimeError)
+    self.assertEqual(db.batch.failed(results), models[2:4])
+
+    retry_results = SampleModel.put_multi(db.batch.failed(results))
+    self.assertTrue(all(result.ok for result in retry_results))
+    self.assertEqual(self.get_entity_count('SampleModel'), 5)
+
+  def test_get_multi_returns_result_per_key(self):
+    models = self.create_models(3)
+    SampleModel.put_multi(models)
+    keys = [models[2].key(), SampleModel.generate_key('absent'),
+            models[0].key()]
+    results = SampleModel.get_multi(keys)
+    self.assertEqual([result.item for result in results], keys)
+    self.assertEqual(results[0].value.int1, 2)
+    self.assertIsNone(results[1].value)
+    self.assertEqual(results[2].value.int1, 0)
+
+  def test_delete_multi(self):
+    models = self.create_models(4)
+    SampleModel.put_multi(models)
+    results = SampleModel.delete_multi(
+        [model.key() for model in models], parallel=True)
+    self.assertTrue(all(result.ok for result in results))
+    self.assertEqual(self.get_entity_count('SampleModel'), 0)
+
+  def test_module_put_multi_is_chunked(self):
+    models = self.create_models(5)
+    client = db.Model.get_client()
+    with patch.object(constants, 'MAX_MUTATIONS_PER_COMMIT', 2), \
+            patch.object(client, 'put_multi', wraps=client.put_multi) as put_multi:
+      db.put_multi([model.__entity__ for model in models])
+    self.assertEqual(put_multi.call_count, 3)
+    self.assertEqual(self.get_entity_count('SampleModel'), 5)
@@ -0,0 +1,111 @@
+"""
+    This module defines the testcases for the process wide entity cache.
+"""
+import fnmatch
+
+from mock import patch
+
+from gaelib.db import cache
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import CachedSampleModel, SampleModel
+
+
+class FakeTimer():
+
+  def __init__(self):
+    self.now = 0
+
+  def __call__(self):
+    return self.now
+
+
+class FakeRedis():
+  """
+      A local stand-in for a redis client
+  """
+
+  def __init__(self):
+    self.values = {}
+
+  def mget(self, keys):
+    return [self.values.get(key) for key in keys]
+
+  def set(self, key, value, ex=None):
+    self.values[key] = value
+
+  def delete(self, *keys):
+    for key in keys:
+      self.values.pop(key, None)
+
+  def scan_iter(self, match):
+    return [key for key in self.values if fnmatch.fnmatch(key, match)]
+
+
+class EntityCacheTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.timer = FakeTimer()
+    self.backend = cache.MemoryCacheBackend(maxsize=3, timer=self.timer)
+    cache.set_backend(self.backend)
+    self.datastore_client = CachedSampleModel.get_client()
+
+  def tearDown(self):
+    cache.set_backend(None)
+    super().tearDown()
+
+  def get_without_rpc(self, key):
+    with patch.object(self.datastore_client, 'get_multi') as get_multi:
+      model = CachedSampleModel.get(key)
+    get_multi.assert_not_called()
+    return model
+
+  def test_put_populates_cache(self):
+    model = CachedSampleModel(key_str='cached', string1='value1')
+    model.put()
+    self.assertEqual(self.get_without_rpc(model.key()).string1, 'value1')
+    self.assertTrue(CachedSampleModel(key=model.key()).retrieved())
+
+  def test_lookup_populates_cache(self):
+    model = CachedSampleModel(key_str='looked_up', string1='value1')
+    model.put()
+    self.backend.clear()
+    CachedSampleModel.retrieve(key_strs=['looked_up'])
+    self.assertEqual(self.get_without_rpc(model.key()).string1, 'value1')
+
+  def test_put_and_delete_refresh_cache(self):
+    model = CachedSampleModel(key_str='refreshed', string1='value1')
+    model.put()
+    model.update(string1='value2')
+    model.put()
+    self.assertEqual(self.get_without_rpc(model.key()).string1, 'value2')
+    CachedSampleModel.delete_multi([model.key()])
+    self.assertEqual(len(self.backend), 0)
+    self.assertIsNone(CachedSampleModel.get(model.key()))
+
+  def test_entries_expire_after_ttl(self):
+    model = CachedSampleModel(key_str='expiring', string1='value1')
+    model.put()
+    self.timer.now = CachedSampleModel.__cache_ttl__ + 1
+    with patch.object(self.datastore_client, 'get_multi',
+                      wraps=self.datastore_client.get_multi) as get_multi:
+      CachedSampleModel.get(model.key())
+    get_multi.assert_called_once()
+
+  def test_cache_is_size_bounded(self):
+    for i in range(5):
+      CachedSampleModel(key_str='bounded{}'.format(i)).put()
+    self.assertEqual(len(self.backend), 3)
+
+  def test_models_without_opt_in_are_not_cached(self):
+    SampleModel(key_str='not_cached').put()
+    self.assertEqual(len(self.backend), 0)
+
+  def test_redis_backend(self):
+    cache.set_backend(cache.RedisCacheBackend(FakeRedis()))
+    model = CachedSampleModel(key_str='shared', string1='value1')
+    model.put()
+    self.assertEqual(self.get_without_rpc(model.key()).string1, 'value1')
+    model.delete()
+    self.assertEqual(cache.get_backend().client.values, {})
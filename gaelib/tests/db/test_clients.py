@@ -0,0 +1,29 @@
+"""
+    This module defines the testcases for the datastore client registry.
+"""
+from gaelib.auth.models import User
+from gaelib.db import clients, helpers
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import SampleModel
+
+
+class ClientRegistryTestCase(BaseUnitTestCase):
+
+  def test_models_share_one_client(self):
+    client = clients.get_client()
+    self.assertIs(SampleModel.get_client(), client)
+    self.assertIs(User.get_client(), client)
+    self.assertIs(clients.get_client(helpers.get_datastore_namespace()),
+                  client)
+
+  def test_clients_are_kept_per_namespace(self):
+    other = clients.get_client('other')
+    self.assertIsNot(other, clients.get_client())
+    self.assertEqual(other.namespace, 'other')
+    self.assertIs(clients.get_client('other'), other)
+
+  def test_clients_are_recreated_after_fork(self):
+    client = clients.get_client()
+    clients._reset_after_fork()
+    self.assertIsNot(clients.get_client(), client)
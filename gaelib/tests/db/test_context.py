@@ -0,0 +1,67 @@
+"""
+    This module defines the testcases for the request identity map.
+"""
+from flask import g
+from mock import patch
+
+from gaelib.db import context
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import SampleModel
+
+
+class IdentityMapTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.saved = SampleModel(key_str='cached', string1='value1')
+    self.saved.put()
+    self.datastore_client = SampleModel.get_client()
+
+  def test_repeat_lookups_are_served_from_memory(self):
+    with self.app_for_test.test_request_context():
+      key = self.saved.key()
+      # Client.get is a thin wrapper over get_multi
+      with patch.object(self.datastore_client, 'get_multi',
+                        wraps=self.datastore_client.get_multi) as get_multi:
+        first = SampleModel(key=key)
+        second = SampleModel.get(key)
+        third = SampleModel.retrieve(key_strs=['cached'])[0]
+      self.assertEqual(get_multi.call_count, 1)
+      for model in [first, second, third]:
+        self.assertTrue(model.retrieved())
+        self.assertEqual(model.string1, 'value1')
+
+  def test_cached_state_is_not_shared(self):
+    with self.app_for_test.test_request_context():
+      first = SampleModel.get(self.saved.key())
+      first.string1 = 'changed but not saved'
+      second = SampleModel.get(self.saved.key())
+      self.assertEqual(second.string1, 'value1')
+
+  def test_put_and_delete_keep_map_coherent(self):
+    with self.app_for_test.test_request_context():
+      model = SampleModel.get(self.saved.key())
+      model.update(string1='value2')
+      model.put()
+      with patch.object(self.datastore_client, 'get_multi') as get_multi:
+        self.assertEqual(SampleModel.get(model.key()).string1, 'value2')
+        model.delete()
+        self.assertIsNone(SampleModel.get(model.key()))
+        self.assertFalse(SampleModel(key=model.key()).retrieved())
+      get_multi.assert_not_called()
+
+  def test_no_identity_map_outside_app_context(self):
+    self.assertIsNone(context.get_identity_map())
+    with patch.object(self.datastore_client, 'get_multi',
+                      wraps=self.datastore_client.get_multi) as get_multi:
+      SampleModel.get(self.saved.key())
+      SampleModel.get(self.saved.key())
+    self.assertEqual(get_multi.call_count, 2)
+
+  def test_identity_map_is_cleared_at_teardown(self):
+    with self.app_for_test.test_request_context():
+      SampleModel.get(self.saved.key())
+      self.assertEqual(len(context.get_identity_map()), 1)
+      self.app_for_test.do_teardown_request()
+      self.assertNotIn('_gaelib_identity_map', g)
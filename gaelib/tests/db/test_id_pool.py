@@ -0,0 +1,56 @@
+"""
+    This module defines the testcases for the id pool.
+"""
+from mock import patch
+
+from gaelib.db import id_pool
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import SampleModel
+
+
+class IdPoolTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    id_pool.clear_pools()
+
+  def tearDown(self):
+    id_pool.clear_pools()
+    super().tearDown()
+
+  def test_refill_allocates_a_block(self):
+    pool = id_pool.IdPool(SampleModel.get_client(), 'SampleModel', block_size=10)
+    pool.refill()
+    self.assertEqual(len(pool), 10)
+    keys = [pool.next_key() for _ in range(5)]
+    self.assertTrue(all(not key.is_partial for key in keys))
+    self.assertEqual(len(set(key.id for key in keys)), 5)
+
+  def test_empty_pool_returns_incomplete_key_and_refills(self):
+    pool = id_pool.IdPool(SampleModel.get_client(), 'SampleModel', block_size=10)
+    with patch.object(pool, 'refill_async') as refill_async:
+      key = pool.next_key()
+    self.assertTrue(key.is_partial)
+    self.assertEqual(key.kind, 'SampleModel')
+    refill_async.assert_called_once_with()
+
+  def test_pool_is_shared_per_kind(self):
+    self.assertIs(id_pool.get_pool(SampleModel), id_pool.get_pool(SampleModel))
+
+  def test_model_construction_uses_pool_without_rpc(self):
+    id_pool.get_pool(SampleModel).refill()
+    client = SampleModel.get_client()
+    with patch.object(client, 'allocate_ids') as allocate_ids:
+      model = SampleModel(string1='pooled')
+    allocate_ids.assert_not_called()
+    self.assertFalse(model.key().is_partial)
+
+  def test_incomplete_key_is_completed_on_put(self):
+    pool = id_pool.get_pool(SampleModel)
+    with patch.object(pool, 'refill_async'):
+      model = SampleModel(string1='incomplete')
+    self.assertTrue(model.key().is_partial)
+    model.put()
+    self.assertFalse(model.key().is_partial)
+    self.assertTrue(SampleModel(key=model.key()).retrieved())
@@ -0,0 +1,87 @@
+"""
+    This module defines the testcases for the per request rpc stats.
+"""
+import json
+
+from flask import Response
+
+from gaelib.db import instrumentation, transaction
+from gaelib.tests.base import BaseUnitTestCase
+from gaelib.utils import web
+
+from .model import SampleModel
+
+
+class InstrumentationTestCase(BaseUnitTestCase):
+
+  def test_rpcs_are_recorded_in_a_request(self):
+    with self.app_for_test.test_request_context():
+      model = SampleModel(key_str='recorded', string1='value1')
+      model.put()
+      SampleModel.get(model.key())
+      SampleModel.retrieve(filters=[('string1', '=', 'value1')])
+      model.delete()
+      records = instrumentation.get_current().records
+
+    self.assertEqual([(record.method, record.kind, record.count)
+                      for record in records],
+                     [('get_multi', 'SampleModel', 1),
+                      ('put_multi', 'SampleModel', 1),
+                      ('run_query', 'SampleModel', 1),
+                      ('delete_multi', 'SampleModel', 1)])
+    put_record = records[1]
+    self.assertGreater(put_record.bytes, len('value1'))
+    self.assertGreaterEqual(put_record.duration, 0)
+
+  def test_nothing_is_recorded_outside_a_request(self):
+    SampleModel(key_str='unrecorded', string1='value1').put()
+    self.assertIsNone(instrumentation.get_current())
+
+  def test_transaction_writes_are_recorded_with_the_commit(self):
+    with self.app_for_test.test_request_context():
+      with transaction():
+        SampleModel(key_str='first', string1='value1').put()
+        SampleModel(key_str='second', string1='value2').put()
+      records = instrumentation.get_current().records
+
+    # The lookups made by the constructors, but no separate write
+    self.assertEqual([(record.method, record.count) for record in records],
+                     [('begin_transaction', 0), ('get_multi', 1),
+                      ('get_multi', 1), ('commit', 2)])
+
+  def test_summary_groups_repeated_calls(self):
+    with self.app_for_test.test_request_context():
+      for email in ['a@example.com', 'b@example.com', 'c@example.com']:
+        SampleModel.retrieve(filters=[('string1', '=', email)])
+      summary = instrumentation.finish_request()
+      self.assertIsNone(instrumentation.finish_request())
+
+    self.assertEqual(summary['rpcs'], 3)
+    self.assertEqual(summary['calls'][0]['method'], 'run_query')
+    self.assertEqual(summary['calls'][0]['kind'], 'SampleModel')
+    self.assertEqual(summary['calls'][0]['rpcs'], 3)
+
+  def test_server_timing_header_and_log_line(self):
+    self.app_for_test.config['DATASTORE_SERVER_TIMING'] = True
+    try:
+      with self.app_for_test.test_request_context('/timed'):
+        SampleModel(key_str='timed', string1='value1').put()
+        response = web.add_server_timing(Response())
+        with self.assertLogs(self.app_for_test.logger, 'INFO') as logs:
+          web.log_datastore_rpcs()
+    finally:
+      self.app_for_test.config['DATASTORE_SERVER_TIMING'] = False
+
+    header = response.headers['Server-Timing']
+    self.assertTrue(header.startswith('datastore;dur='))
+    self.assertIn('datastore-put-multi;dur=', header)
+    message = logs.records[0].getMessage()
+    summary = json.loads(message.split(': ', 1)[1])
+    self.assertEqual(summary['request'], 'GET /timed')
+    self.assertEqual(summary['rpcs'], 2)
+
+  def test_server_timing_is_off_by_default(self):
+    with self.app_for_test.test_request_context():
+      SampleModel(key_str='untimed', string1='value1').put()
+      response = web.add_server_timing(Response())
+    self.assertNotIn('Server-Timing', response.headers)
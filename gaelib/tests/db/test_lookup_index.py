@@ -0,0 +1,119 @@
+"""
+    This module defines the testcases for lookup indexed properties.
+"""
+from google.cloud import datastore
+from mock import patch
+
+from gaelib.db import UniqueValueError, properties, transaction
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import LookupSampleModel, SampleModel
+
+EMAIL_INDEX = 'LookupSampleModel_by_email'
+HANDLE_INDEX = 'LookupSampleModel_by_handle'
+
+
+class LookupIndexTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.model = LookupSampleModel(email='a@example.com', handle='alpha',
+                                   number=7, string1='value1')
+    self.model.put()
+    self.datastore_client = LookupSampleModel.get_client()
+
+  def test_get_by_uses_key_lookups(self):
+    with patch.object(LookupSampleModel, 'query') as query:
+      for name, value in [('email', 'a@example.com'), ('handle', 'alpha'),
+                          ('number', 7)]:
+        found = LookupSampleModel.get_by(name, value)
+        self.assertEqual(found.key(), self.model.key())
+    query.assert_not_called()
+    self.assertEqual(self.get_entity_count(EMAIL_INDEX), 1)
+
+  def test_changed_value_moves_the_index_entity(self):
+    model = LookupSampleModel.get_by('email', 'a@example.com')
+    model.email = 'b@example.com'
+    model.put()
+    self.assertIsNone(LookupSampleModel.get_by('email', 'a@example.com'))
+    self.assertEqual(LookupSampleModel.get_by('email', 'b@example.com').key(),
+                     self.model.key())
+    self.assertEqual(self.get_entity_count(EMAIL_INDEX), 1)
+
+  def test_other_changes_do_not_use_a_transaction(self):
+    model = LookupSampleModel.get(self.model.key())
+    model.string1 = 'value2'
+    with patch.object(self.datastore_client, 'transaction') as begin:
+      model.put()
+    begin.assert_not_called()
+
+    new_model = LookupSampleModel(string1='value3')
+    with patch.object(self.datastore_client, 'transaction') as begin:
+      new_model.put()
+    begin.assert_not_called()
+    self.assertIsNotNone(LookupSampleModel.get(new_model.key()))
+
+  def test_delete_removes_index_entities(self):
+    other = LookupSampleModel(email='c@example.com', handle='gamma')
+    other.put()
+    self.model.delete()
+    LookupSampleModel.delete_multi([other.key()])
+    self.assertEqual(self.get_entity_count(EMAIL_INDEX), 0)
+    self.assertEqual(self.get_entity_count(HANDLE_INDEX), 0)
+    self.assertIsNone(LookupSampleModel.get_by('handle', 'alpha'))
+
+  def test_unique_values_are_enforced(self):
+    taken = LookupSampleModel(email='d@example.com', handle='alpha')
+    with self.assertRaises(UniqueValueError):
+      taken.put()
+    self.assertIsNone(LookupSampleModel.get_by('email', 'd@example.com'))
+
+    first = LookupSampleModel(handle='beta')
+    second = LookupSampleModel(handle='beta')
+    results = LookupSampleModel.put_multi([first, second])
+    # The models share a chunk, so neither is written
+    for result in results:
+      self.assertIsInstance(result.error, UniqueValueError)
+    self.assertIsNone(LookupSampleModel.get_by('handle', 'beta'))
+
+  def test_values_can_be_reused_once_released(self):
+    self.model.handle = 'omega'
+    self.model.put()
+    other = LookupSampleModel(handle='alpha')
+    other.put()
+    self.assertEqual(LookupSampleModel.get_by('handle', 'alpha').key(),
+                     other.key())
+
+  def test_writes_join_the_current_transaction(self):
+    with transaction():
+      model = LookupSampleModel(email='e@example.com')
+      model.put()
+      self.assertEqual(self.get_entity_count(EMAIL_INDEX), 1)
+    self.assertEqual(self.get_entity_count(EMAIL_INDEX), 2)
+    self.assertEqual(LookupSampleModel.get_by('email', 'e@example.com').key(),
+                     model.key())
+
+  def test_unindexed_values_are_found_and_indexed(self):
+    # Stored before the property had a lookup index
+    entity = datastore.Entity(key=self.datastore_client.key(
+        'LookupSampleModel', 'legacy'))
+    entity['email'] = 'legacy@example.com'
+    self.datastore_client.put(entity)
+
+    found = LookupSampleModel.get_by('email', 'legacy@example.com')
+    self.assertEqual(found.key(), entity.key)
+    self.assertEqual(self.get_entity_count(EMAIL_INDEX), 2)
+
+  def test_stale_index_entities_are_not_trusted(self):
+    entity = self.datastore_client.get(self.model.key())
+    entity['email'] = 'changed@example.com'
+    self.datastore_client.put(entity)
+    self.assertIsNone(LookupSampleModel.get_by('email', 'a@example.com'))
+
+  def test_get_by_needs_a_lookup_index(self):
+    with self.assertRaises(AttributeError):
+      LookupSampleModel.get_by('string1', 'value1')
+    with self.assertRaises(AttributeError):
+      SampleModel.get_by('string1', 'value1')
+    with self.assertRaises(ValueError):
+      properties.IntegerProperty(repeated=True, lookup_index=True)
@@ -0,0 +1,130 @@
+"""
+    This module defines the testcases for the in-memory datastore backend.
+"""
+from datetime import datetime
+
+from google.api_core import exceptions
+from google.cloud import datastore
+
+from gaelib.db import clients, memory
+from gaelib.tests.base import BaseUnitTestCase
+
+
+class MemoryBackendTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.store = memory.MemoryStore()
+    self.client = memory.MemoryClient(namespace='test', store=self.store)
+
+  def put(self, key_name, **values):
+    entity = datastore.Entity(self.client.key('Sample', key_name))
+    entity.update(values)
+    self.client.put(entity)
+    return entity
+
+  def names(self, query, **kwargs):
+    return [entity.key.name for entity in query.fetch(**kwargs)]
+
+  def test_selected_by_configuration(self):
+    self.assertIsInstance(clients.get_client(), memory.MemoryClient)
+
+  def test_get_put_delete(self):
+    entity = self.put('a', value=1)
+    missing = []
+    found = self.client.get_multi(
+        [entity.key, self.client.key('Sample', 'b')], missing=missing)
+    self.assertEqual([item['value'] for item in found], [1])
+    self.assertEqual([item.key.name for item in missing], ['b'])
+    found[0]['value'] = 2
+    self.assertEqual(self.client.get(entity.key)['value'], 1)
+    self.client.delete(entity.key)
+    self.assertIsNone(self.client.get(entity.key))
+
+  def test_keys_are_completed_and_allocated(self):
+    entity = datastore.Entity(self.client.key('Sample'))
+    self.client.put(entity)
+    self.assertFalse(entity.key.is_partial)
+    keys = self.client.allocate_ids(self.client.key('Sample'), 3)
+    self.assertEqual(len({key.id for key in keys}), 3)
+    self.assertNotIn(entity.key.id, [key.id for key in keys])
+
+  def test_filters_and_order(self):
+    self.put('a', value=3, tags=['x', 'y'])
+    self.put('b', value=1, tags=['y'])
+    self.put('c', value=2, when=datetime(2020, 1, 1))
+    self.put('d', value='text')
+    query = self.client.query(kind='Sample')
+    query.add_filter('value', '>=', 2)
+    query.order = ['-value']
+    self.assertEqual(self.names(query), ['a', 'c'])
+
+    query = self.client.query(kind='Sample')
+    query.add_filter('tags', '=', 'y')
+    self.assertEqual(self.names(query), ['a', 'b'])
+
+    query = self.client.query(kind='Sample', order=['value'])
+    query.add_filter('value', 'IN', [1, 'text'])
+    self.assertEqual(self.names(query), ['b', 'd'])
+
+  def test_unindexed_properties_do_not_match(self):
+    entity = datastore.Entity(self.client.key('Sample', 'a'),
+                                     exclude_from_indexes=('notes',))
+    entity['notes'] = 'text'
+    self.client.put(entity)
+    query = self.client.query(kind='Sample')
+    query.add_filter('notes', '=', 'text')
+    self.assertEqual(self.names(query), [])
+
+  def test_limits_and_cursors(self):
+    for name in 'abcde':
+      self.put(name)
+    query = self.client.query(kind='Sample')
+    iterator = query.fetch(limit=2)
+    self.assertEqual([entity.key.name for entity in next(iterator.pages)],
+                     ['a', 'b'])
+    cursor = iterator.next_page_token
+    self.assertEqual(self.names(query, start_cursor=cursor), ['c', 'd', 'e'])
+    iterator = query.fetch(start_cursor=cursor.decode())
+    list(iterator)
+    self.assertIsNone(iterator.next_page_token)
+
+  def test_namespaces_are_separate(self):
+    self.put('a')
+    other = memory.MemoryClient(namespace='other', store=self.store)
+    self.assertEqual(self.names(other.query(kind='Sample')), [])
+    self.assertEqual(
+        [entity.key.name for entity in self.client.query(kind='__kind__').fetch()],
+        ['Sample'])
+
+  def test_projection_and_keys_only(self):
+    self.put('a', value=1, other=2)
+    query = self.client.query(kind='Sample', projection=['value'])
+    self.assertEqual(dict(next(iter(query.fetch()))), {'value': 1})
+    query = self.client.query(kind='Sample')
+    query.keys_only()
+    self.assertEqual(dict(next(iter(query.fetch()))), {})
+
+  def test_transaction_commits_and_rolls_back(self):
+    with self.client.transaction():
+      self.put('a')
+      self.assertIsNone(self.client.get(self.client.key('Sample', 'a')))
+    self.assertIsNotNone(self.client.get(self.client.key('Sample', 'a')))
+    with self.assertRaises(RuntimeError):
+      with self.client.transaction():
+        self.put('b')
+        raise RuntimeError('failed')
+    self.assertIsNone(self.client.get(self.client.key('Sample', 'b')))
+    self.assertIsNone(self.client.current_transaction)
+
+  def test_conflicting_transaction_is_aborted(self):
+    key = self.put('a', value=1).key
+    with self.assertRaises(exceptions.Aborted):
+      with self.client.transaction():
+        entity = self.client.get(key)
+        # A write from outside the transaction
+        other = memory.MemoryClient(namespace='test', store=self.store)
+        other.put(datastore.Entity(key))
+        entity['value'] = 2
+        self.client.put(entity)
+    self.assertNotIn('value', self.client.get(key))
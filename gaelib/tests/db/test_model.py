@@ -1,9 +1,14 @@
 """
     This module defines the testcases for the Model class.
 """
+from datetime import datetime
+
+from mock import patch
+
+from gaelib.db import constants, properties
 from gaelib.tests.base import BaseUnitTestCase
 
-from .model import SampleModel
+from .model import DefaultsSampleModel, SampleModel, SerializedSampleModel
 
 
 class ModelUnitTestCase(BaseUnitTestCase):
@@ -132,3 +137,130 @@ class ModelUnitTestCase(BaseUnitTestCase):
             self.assertGreaterEqual(last_value,obj.int1, "Failed to order items")
             last_value = obj.int1
         self.assertEqual(len(items),limit, "Failed to apply limit. Fetched {} instead of {} items".format(len(items),limit))
+
+    def test_attribute_assignment_writes_through(self):
+        model = SampleModel(key_str = 'write_through')
+        model.string1 = 'assigned'
+        self.assertEqual(model.__entity__['string1'], 'assigned', "Assignment did not reach the entity")
+        self.assertNotIn('string1', model.__dict__, "Assignment landed on the instance")
+        model.put()
+
+        model = SampleModel(key_str = 'write_through')
+        self.assertEqual(model.string1, 'assigned', "Assigned value was not saved")
+
+    def test_attribute_assignment_is_validated(self):
+        model = SampleModel()
+        with self.assertRaises(ValueError):
+            model.int1 = 'not an int'
+
+    def test_property_access_on_class(self):
+        self.assertIsInstance(SampleModel.string1, properties.Property)
+        self.assertEqual(set(SampleModel.__registry__), {'string1', 'string2', 'int1', 'float1', 'bool1'})
+
+    def test_registry_defaults_and_index_flags(self):
+        registry = DefaultsSampleModel.__registry__
+        self.assertEqual(dict(registry.defaults), {'string1': 'default1', 'int1': 1})
+        self.assertEqual(registry.unindexed, ('notes',))
+        self.assertRaises(AttributeError, setattr, registry, 'defaults', {})
+        with self.assertRaises(TypeError):
+            registry.properties['int1'] = None
+
+        model = DefaultsSampleModel(notes = 'long text')
+        self.assertEqual(model.string1, 'default1', "Default not applied")
+        self.assertEqual(model.int1, 1, "Default not applied")
+        self.assertIn('notes', model.__entity__.exclude_from_indexes, "Unindexed flag not applied")
+
+    def test_unknown_keyword_raises(self):
+        self.assertRaises(AttributeError, self.create_object, not_a_property = 1)
+
+    def test_retrieve_key_strs_keeps_order_and_marks_missing(self):
+        for key_str in ['a', 'b', 'c']:
+            SampleModel(key_str = key_str, string1 = key_str).put()
+
+        items = SampleModel.retrieve(key_strs = ['c', 'missing', 'a', 'b', 'a'])
+        self.assertEqual([item.string1 if item else None for item in items], ['c', None, 'a', 'b', 'a'])
+
+        items = SampleModel.retrieve(key_strs = ['c', 'missing', 'a'], skip_missing = True)
+        self.assertEqual([item.string1 for item in items], ['c', 'a'])
+
+    def test_retrieve_key_strs_is_chunked(self):
+        key_strs = ['chunk{}'.format(i) for i in range(7)]
+        for key_str in key_strs:
+            SampleModel(key_str = key_str, string1 = key_str).put()
+
+        client = SampleModel.get_client()
+        with patch.object(constants, 'MAX_KEYS_PER_LOOKUP', 3), \
+                patch.object(client, 'get_multi', wraps = client.get_multi) as get_multi:
+            items = SampleModel.retrieve(key_strs = list(reversed(key_strs)))
+        self.assertEqual(get_multi.call_count, 3, "Keys were not split into chunks")
+        self.assertEqual([item.string1 for item in items], list(reversed(key_strs)))
+
+    def test_changes_are_tracked(self):
+        model = SampleModel(key_str = 'tracked', string1 = 'value1', int1 = 1)
+        self.assertTrue(model.is_dirty(), "New model not dirty")
+        model.put()
+        self.assertFalse(model.is_dirty(), "Model dirty after put")
+
+        model = SampleModel(key_str = 'tracked')
+        self.assertFalse(model.is_dirty(), "Loaded model dirty")
+        model.update(string1 = 'value1', int1 = 1)
+        self.assertEqual(model.changed_fields(), [], "Same values marked as changed")
+        model.string1 = 'value2'
+        model.update(int1 = 2, string2 = 'new')
+        self.assertEqual(sorted(model.changed_fields()), ['int1', 'string1', 'string2'])
+        model.update(string1 = 'value1', int1 = 1)
+        self.assertEqual(model.changed_fields(), ['string2'], "Reverted values still marked as changed")
+
+    def test_put_skips_unchanged_models(self):
+        SampleModel(key_str = 'unchanged', string1 = 'value1').put()
+        model = SampleModel(key_str = 'unchanged')
+        client = SampleModel.get_client()
+        with patch.object(client, 'put', wraps = client.put) as put:
+            model.update(string1 = 'value1')
+            model.put()
+            put.assert_not_called()
+            model.put(force = True)
+            self.assertEqual(put.call_count, 1, "force did not write")
+            model.string1 = 'value2'
+            model.put()
+            model.put()
+            self.assertEqual(put.call_count, 2, "Changed model not written once")
+        self.assertEqual(SampleModel(key_str = 'unchanged').string1, 'value2')
+
+    def test_put_multi_skips_unchanged_models(self):
+        SampleModel(key_str = 'clean', string1 = 'value1').put()
+        models = [SampleModel(key_str = 'clean'), SampleModel(key_str = 'dirty', string1 = 'value1')]
+        client = SampleModel.get_client()
+        with patch.object(client, 'put_multi', wraps = client.put_multi) as put_multi:
+            results = SampleModel.put_multi(models)
+        self.assertEqual(put_multi.call_args[0][0], [models[1].__entity__])
+        self.assertEqual([result.value for result in results], [model.key() for model in models])
+
+    def test_from_entity_skips_init(self):
+        entity = SampleModel(key_str = 'hydrated', string1 = 'value1').__entity__
+        with patch.object(SampleModel, 'get_client') as get_client:
+            model = SampleModel.from_entity(entity)
+            models = DefaultsSampleModel.from_entities([entity])
+        get_client.assert_not_called()
+        self.assertEqual(model.key(), entity.key)
+        self.assertEqual(model.string1, 'value1')
+        self.assertTrue(model.retrieved())
+        self.assertFalse(model.is_dirty(), "Hydrated model dirty")
+        self.assertIn('notes', models[0].__entity__.exclude_from_indexes, "Unindexed flag not applied")
+
+    def test_to_dict_and_to_json(self):
+        date = datetime(2020, 1, 2, 3, 4, 5)
+        reference = SampleModel.generate_key('referenced')
+        model = SerializedSampleModel(string1 = 'value1', date1 = date, reference1 = reference, references = [reference])
+        self.assertEqual(model.to_dict(), {'string1': 'value1', 'date1': date, 'reference1': reference, 'references': [reference]})
+        self.assertEqual(model.to_dict(fields = ['string1']), {'string1': 'value1'})
+        urlsafe = reference.to_legacy_urlsafe().decode()
+        self.assertEqual(model.to_json(), {'string1': 'value1', 'date1': '2020-01-02T03:04:05', 'reference1': urlsafe, 'references': [urlsafe]})
+        self.assertEqual(SerializedSampleModel().to_json(fields = ['date1']), {'date1': None})
+        self.assertRaises(AttributeError, model.to_json, fields = ['not_a_property'])
+
+    def test_serialize_many(self):
+        models = [SampleModel(string1 = 'value{}'.format(i), int1 = i) for i in range(3)]
+        rows = SampleModel.serialize_many(models, fields = ['string1', 'int1'])
+        self.assertEqual(rows, [{'string1': 'value{}'.format(i), 'int1': i} for i in range(3)])
+        self.assertEqual(SampleModel.serialize_many(models)[0], models[0].to_json())
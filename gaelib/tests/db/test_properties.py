@@ -0,0 +1,57 @@
+"""
+    This module defines the testcases for property validation.
+"""
+from gaelib.db import model, properties
+from gaelib.tests.base import BaseUnitTestCase
+
+
+class PropertiesTestCase(BaseUnitTestCase):
+
+  def test_type_is_checked(self):
+    prop = properties.StringProperty()
+    self.assertEqual(prop.validate('value'), 'value')
+    self.assertIsNone(prop.validate(None))
+    with self.assertRaises(ValueError):
+      prop.validate(1)
+
+  def test_default_replaces_empty_values(self):
+    prop = properties.IntegerProperty(default=1, choices=[1, 2])
+    self.assertEqual(prop.validate(None), 1)
+    self.assertEqual(prop.validate(0), 1)
+    self.assertEqual(prop.validate(2), 2)
+
+  def test_choices(self):
+    prop = properties.IntegerProperty(choices=[1, 2])
+    with self.assertRaisesRegex(ValueError, 'choices'):
+      prop.validate(3)
+    with self.assertRaisesRegex(ValueError, 'choices'):
+      properties.IntegerProperty(default=3, choices=[1, 2])
+
+  def test_repeated_values(self):
+    prop = properties.FloatProperty(repeated=True)
+    self.assertEqual(prop.validate([1.0, 2.0]), [1.0, 2.0])
+    with self.assertRaisesRegex(ValueError, 'One repeated value'):
+      prop.validate([1.0, 'two', 3.0])
+
+  def test_validate_many(self):
+    prop = properties.IntegerProperty(default=1, choices=[1, 2])
+    self.assertEqual(prop.validate_many([2, None, 1]), [2, 1, 1])
+    with self.assertRaises(ValueError):
+      prop.validate_many([1, 5])
+
+  def test_overridden_validate_is_used(self):
+    class UpperProperty(properties.StringProperty):
+      def validate(self, value):
+        value = super().validate(value)
+        return value.upper() if value else value
+
+    class UpperModel(model.Model):
+      name = UpperProperty()
+
+    instance = UpperModel(name='abc')
+    self.assertEqual(instance.name, 'ABC')
+    instance.name = 'def'
+    self.assertEqual(instance.name, 'DEF')
+    instance.update(name='ghi')
+    self.assertEqual(instance.name, 'GHI')
+    self.assertEqual(UpperModel.name.validate_many(['a', 'b']), ['A', 'B'])
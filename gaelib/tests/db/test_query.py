@@ -0,0 +1,200 @@
+"""
+    This module defines the testcases for the Query class.
+"""
+from google.cloud import datastore
+from mock import Mock, patch
+
+from gaelib.db import constants, context, executor, gather
+from gaelib.db.query import merge_results, split_in_filters
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import SampleModel
+
+
+class QueryTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    for i in range(7):
+      SampleModel(key_str='query{}'.format(i), string1='match', int1=i).put()
+
+  def create_query(self):
+    query = SampleModel.query()
+    query.add_filter('string1', '=', 'match')
+    query.assign_order('int1')
+    return query
+
+  def test_iter_fetches_one_page_per_rpc(self):
+    query = self.create_query()
+    with patch.object(query.__query__, 'fetch',
+                      wraps=query.__query__.fetch) as fetch:
+      values = [model.int1 for model in query.iter(page_size=3)]
+    self.assertEqual(values, list(range(7)))
+    self.assertGreaterEqual(fetch.call_count, 3)
+    for call in fetch.call_args_list:
+      self.assertEqual(call.kwargs['limit'], 3)
+
+  def test_iter_is_lazy(self):
+    query = self.create_query()
+    with patch.object(query.__query__, 'fetch',
+                      wraps=query.__query__.fetch) as fetch:
+      results = query.iter(page_size=3)
+      fetch.assert_not_called()
+      self.assertEqual(next(results).int1, 0)
+      self.assertEqual(next(results).int1, 1)
+      self.assertEqual(fetch.call_count, 1)
+
+  def test_iter_honours_limit(self):
+    query = self.create_query()
+    values = [model.int1 for model in query.iter(page_size=3, limit=5)]
+    self.assertEqual(values, list(range(5)))
+
+  def test_iter_continues_after_an_empty_page(self):
+    query = self.create_query()
+    fetch = query.__query__.fetch
+
+    def fetch_with_empty_batch(limit=None, start_cursor=None):
+      iterator = fetch(limit=limit, start_cursor=start_cursor)
+      if start_cursor is None:
+        # The first batch scanned the first page but returned nothing
+        next(iterator.pages)
+        iterator = Mock(pages=iter([[]]),
+                        next_page_token=iterator.next_page_token)
+      return iterator
+
+    with patch.object(query.__query__, 'fetch',
+                      side_effect=fetch_with_empty_batch):
+      values = [model.int1 for model in query.iter(page_size=3)]
+    self.assertEqual(values, [3, 4, 5, 6])
+
+  def test_iter_resumes_from_cursor(self):
+    query = self.create_query()
+    results = query.iter(page_size=3)
+    for _ in range(4):
+      next(results)
+    # The cursor marks the start of the page being iterated
+    resumed = self.create_query().iter(page_size=3, start_cursor=query.cursor)
+    self.assertEqual([model.int1 for model in resumed], [3, 4, 5, 6])
+
+  def test_fetch_page(self):
+    query = self.create_query()
+    with patch.object(query.__query__, 'fetch',
+                      wraps=query.__query__.fetch) as fetch:
+      results, cursor, more = query.fetch_page(3)
+    self.assertEqual(fetch.call_count, 1)
+    self.assertEqual([model.int1 for model in results], [0, 1, 2])
+    self.assertTrue(more)
+    self.assertIsInstance(cursor, str)
+
+    values = [model.int1 for model in results]
+    while more:
+      results, cursor, more = self.create_query().fetch_page(
+          3, start_cursor=cursor)
+      values.extend(model.int1 for model in results)
+    self.assertEqual(values, list(range(7)))
+
+  def test_retrieve_passes_start_cursor(self):
+    _, cursor, _ = SampleModel.retrieve_page(
+        4, filters=[('string1', '=', 'match')], order='int1')
+    results = SampleModel.retrieve(
+        filters=[('string1', '=', 'match')], order='int1', start_cursor=cursor)
+    self.assertEqual([model.int1 for model in results], [4, 5, 6])
+
+  def test_keys_only(self):
+    query = self.create_query().keys_only()
+    keys = query.fetch()
+    self.assertEqual(keys, [SampleModel.generate_key('query{}'.format(i))
+                            for i in range(7)])
+    self.assertEqual([key.name for key in query.iter(page_size=3)],
+                     ['query{}'.format(i) for i in range(7)])
+
+  def test_projection_returns_read_only_records(self):
+    query = SampleModel.query().project('int1')
+    query.assign_order('int1')
+    records = query.fetch(limit=3)
+    self.assertEqual([record.int1 for record in records], [0, 1, 2])
+    self.assertEqual(records[0].key, SampleModel.generate_key('query0'))
+    self.assertEqual(records[0].to_dict(), {'int1': 0})
+    self.assertFalse(hasattr(records[0], '__dict__'))
+    with self.assertRaises(AttributeError):
+      records[0].int1 = 5
+    self.assertIs(type(records[0]), type(
+        SampleModel.query().project('int1').fetch(limit=1)[0]))
+
+  def test_results_do_not_fill_identity_map(self):
+    with self.app_for_test.test_request_context():
+      SampleModel.query().fetch()
+      SampleModel.query().project('int1').fetch()
+      SampleModel.query().keys_only().fetch()
+      self.assertEqual(len(context.get_identity_map()), 0)
+
+  def test_fetch_async(self):
+    future = self.create_query().fetch_async(limit=2)
+    self.assertEqual([model.int1 for model in future.result()], [0, 1])
+
+  def test_retrieve_async_with_gather(self):
+    futures = [SampleModel.retrieve_async(filters=[('int1', '=', i)])
+               for i in [5, 1, 3]]
+    results = gather(*futures)
+    self.assertEqual([models[0].int1 for models in results], [5, 1, 3])
+
+  def test_gather_errors(self):
+    failing = executor.submit(self.fail)
+    working = SampleModel.retrieve_async(key_strs=['query0'])
+    with self.assertRaises(RuntimeError):
+      gather(failing, working)
+    results = gather(failing, working, return_exceptions=True)
+    self.assertIsInstance(results[0], RuntimeError)
+    self.assertEqual(results[1][0].int1, 0)
+
+  def test_nested_submit_runs_inline(self):
+    def nested():
+      return executor.submit(lambda: executor.in_worker()).result()
+    self.assertTrue(executor.submit(nested).result())
+
+  def fail(self):
+    raise RuntimeError('query failed')
+
+  def test_large_in_filter_is_split(self):
+    values = list(range(-20, 7)) + [3, 5]
+    client = SampleModel.get_client()
+    with patch.object(constants, 'MAX_IN_FILTER_VALUES', 10), \
+            patch.object(client, 'query', wraps=client.query) as query:
+      results = SampleModel.retrieve(filters=[('int1', 'IN', values)],
+                                     order='-int1', limit=4)
+    self.assertEqual(query.call_count, 3)
+    self.assertEqual([model.int1 for model in results], [6, 5, 4, 3])
+
+  def test_merge_results_orders_like_the_datastore(self):
+    def model(key_str, value):
+      entity = datastore.Entity(key=SampleModel.generate_key(key_str))
+      entity['value'] = value
+      return SampleModel.from_entity(entity)
+
+    first = [model('c', 'text'), model('a', None), model('d', [5, 'list'])]
+    second = [model('b', 2), model('e', [1, 9])]
+    key_strs = lambda models: [item.key().name for item in models]
+    # Missing values, then integers, then strings
+    self.assertEqual(key_strs(merge_results([first, second], 'value')),
+                     ['a', 'e', 'b', 'd', 'c'])
+    # Repeated values sort by their largest value when descending
+    self.assertEqual(key_strs(merge_results([first, second], '-value')),
+                     ['c', 'd', 'e', 'b', 'a'])
+    self.assertEqual(key_strs(merge_results([first, second], limit=3)),
+                     ['a', 'b', 'c'])
+
+  def test_split_in_filters(self):
+    with patch.object(constants, 'MAX_IN_FILTER_VALUES', 2):
+      self.assertIsNone(split_in_filters([('int1', 'IN', [1, 2])]))
+      filter_lists = split_in_filters([('string1', '=', 'match'),
+                                       ('int1', 'IN', [1, 2, 3])])
+    self.assertEqual(filter_lists, [
+        [('string1', '=', 'match'), ('int1', 'IN', [1, 2])],
+        [('string1', '=', 'match'), ('int1', 'IN', [3])],
+    ])
+
+  def test_split_in_filter_rejects_cursor(self):
+    with patch.object(constants, 'MAX_IN_FILTER_VALUES', 2):
+      with self.assertRaises(ValueError):
+        SampleModel.retrieve(filters=[('int1', 'IN', [1, 2, 3])],
+                             start_cursor='cursor')
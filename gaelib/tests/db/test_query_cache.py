@@ -0,0 +1,105 @@
+"""
+    This module defines the testcases for the query result cache.
+"""
+from google.cloud import datastore
+from mock import patch
+
+from gaelib.db import query_cache
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import QueryCachedSampleModel, SampleModel
+
+
+class QueryCacheTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.now = 0
+    self.timer_patch = patch.object(query_cache, '_timer', lambda: self.now)
+    self.timer_patch.start()
+    for i in range(3):
+      QueryCachedSampleModel(key_str='cached{}'.format(i), string1='match',
+                             int1=i).put()
+    self.datastore_client = QueryCachedSampleModel.get_client()
+
+  def tearDown(self):
+    self.timer_patch.stop()
+    super().tearDown()
+
+  def retrieve(self, **kwargs):
+    return QueryCachedSampleModel.retrieve(
+        filters=[('string1', '=', 'match')], order='int1', **kwargs)
+
+  def test_repeated_query_is_served_from_cache(self):
+    self.assertEqual([model.int1 for model in self.retrieve()], [0, 1, 2])
+    # A write made outside gaelib, as another process would, goes
+    # unnoticed until the ttl expires
+    self.datastore_client.delete(QueryCachedSampleModel.generate_key('cached0'))
+    results = self.retrieve()
+    self.assertEqual([model.int1 for model in results], [0, 1, 2])
+    stats = query_cache.stats()
+    self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+    self.assertEqual(stats['hit_rate'], 0.5)
+    self.assertEqual(stats['entries'], 1)
+    self.assertGreater(stats['bytes'], 0)
+
+  def test_shape_is_normalized(self):
+    self.retrieve(limit=2)
+    query = QueryCachedSampleModel.query()
+    query.assign_order(['int1'])
+    query.add_filter('string1', '=', 'match')
+    self.assertEqual(len(query.fetch(limit=2)), 2)
+    self.assertEqual(query_cache.stats()['hits'], 1)
+    self.retrieve(limit=1)
+    self.assertEqual(query_cache.stats()['misses'], 2)
+
+  def test_shape_includes_ancestor(self):
+    for parent in ['parent1', 'parent2']:
+      key = self.datastore_client.key('Parent', parent,
+                                      'QueryCachedSampleModel', parent)
+      entity = datastore.Entity(key=key)
+      entity['string1'] = parent
+      self.datastore_client.put(entity)
+
+    for parent in ['parent1', 'parent2']:
+      ancestor = self.datastore_client.key('Parent', parent)
+      results = QueryCachedSampleModel.query(ancestor=ancestor).fetch()
+      self.assertEqual([model.string1 for model in results], [parent])
+    self.assertEqual(query_cache.stats()['hits'], 0)
+
+  def test_writes_invalidate_kind(self):
+    self.retrieve()
+    QueryCachedSampleModel(key_str='cached3', string1='match', int1=3).put()
+    self.assertEqual([model.int1 for model in self.retrieve()],
+                     [0, 1, 2, 3])
+    QueryCachedSampleModel(key_str='cached0').delete()
+    self.assertEqual([model.int1 for model in self.retrieve()], [1, 2, 3])
+    self.assertEqual(query_cache.stats()['hits'], 0)
+
+  def test_results_expire_after_ttl(self):
+    self.retrieve()
+    self.now = QueryCachedSampleModel.__query_cache_ttl__ + 1
+    self.retrieve()
+    self.assertEqual(query_cache.stats()['misses'], 2)
+
+  def test_memory_limit(self):
+    with patch.object(QueryCachedSampleModel, '__query_cache_size__', 1):
+      self.retrieve()
+    self.assertEqual(query_cache.stats()['entries'], 0)
+
+  def test_cached_results_are_not_shared(self):
+    self.retrieve()[0].string1 = 'changed but not saved'
+    self.assertEqual(self.retrieve()[0].string1, 'match')
+
+  def test_fetch_page_is_cached(self):
+    results, cursor, _ = QueryCachedSampleModel.retrieve_page(2, order='int1')
+    cached, cached_cursor, _ = QueryCachedSampleModel.retrieve_page(
+        2, order='int1')
+    self.assertEqual(cached_cursor, cursor)
+    self.assertEqual([model.int1 for model in cached], [0, 1])
+    self.assertEqual(query_cache.stats()['hits'], 1)
+
+  def test_models_without_opt_in_are_not_cached(self):
+    SampleModel(string1='match').put()
+    SampleModel.retrieve(filters=[('string1', '=', 'match')])
+    self.assertEqual(query_cache.stats()['misses'], 0)
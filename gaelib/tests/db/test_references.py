@@ -0,0 +1,100 @@
+"""
+    This module defines the testcases for loading referenced models.
+"""
+from mock import patch
+
+from gaelib.db import model
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import (NestedReferenceSampleModel, SampleModel,
+                    SerializedSampleModel)
+
+
+class ReferencePrefetchTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.targets = [SampleModel(key_str='target{}'.format(index),
+                                string1='value{}'.format(index))
+                    for index in range(3)]
+    SampleModel.put_multi(self.targets)
+    self.missing_key = SampleModel.generate_key('missing')
+    target_keys = [target.key() for target in self.targets]
+    self.sources = [
+        SerializedSampleModel(string1='source{}'.format(index),
+                              reference1=target_keys[index % 3],
+                              references=[target_keys[2], self.missing_key])
+        for index in range(5)]
+    SerializedSampleModel.put_multi(self.sources)
+    self.datastore_client = SampleModel.get_client()
+
+  def count_lookups(self):
+    return patch.object(self.datastore_client, 'get_multi',
+                        wraps=self.datastore_client.get_multi)
+
+  def test_prefetch_references_uses_one_lookup(self):
+    sources = SerializedSampleModel.query().fetch()
+    with self.count_lookups() as get_multi:
+      model.Model.prefetch_references(sources, ['reference1', 'references'])
+      for source in sources:
+        target = source.reference('reference1')
+        self.assertEqual(target.key(), source.reference1)
+        repeated = source.reference('references')
+        self.assertEqual(repeated[0].string1, 'value2')
+        self.assertIsNone(repeated[1])
+    self.assertEqual(get_multi.call_count, 1)
+    self.assertEqual(len(get_multi.call_args[0][0]), 4)
+
+  def test_query_prefetch(self):
+    with self.count_lookups() as get_multi:
+      sources = SerializedSampleModel.query().prefetch('reference1').fetch()
+      values = sorted(source.reference('reference1').string1
+                      for source in sources)
+    self.assertEqual(get_multi.call_count, 1)
+    self.assertEqual(values, ['value0', 'value0', 'value1', 'value1',
+                              'value2'])
+
+  def test_query_iter_prefetches_per_page(self):
+    query = SerializedSampleModel.query().prefetch('reference1')
+    with self.count_lookups() as get_multi:
+      sources = list(query.iter(page_size=2))
+      for source in sources:
+        source.reference('reference1')
+    self.assertEqual(len(sources), 5)
+    self.assertEqual(get_multi.call_count, 3)
+
+  def test_nested_prefetch(self):
+    for source in self.sources:
+      NestedReferenceSampleModel(parent=source.key(), string1='nested').put()
+    with self.count_lookups() as get_multi:
+      nested = NestedReferenceSampleModel.query().prefetch(
+          'parent.reference1').fetch()
+      targets = {item.reference('parent').reference('reference1').string1
+                 for item in nested}
+    self.assertEqual(get_multi.call_count, 2)
+    self.assertEqual(targets, {'value0', 'value1', 'value2'})
+
+  def test_prefetch_reuses_identity_map(self):
+    with self.app_for_test.test_request_context():
+      for target in self.targets:
+        SampleModel.get(target.key())
+      sources = SerializedSampleModel.query().fetch()
+      with self.count_lookups() as get_multi:
+        model.Model.prefetch_references(sources, ['reference1'])
+      get_multi.assert_not_called()
+
+  def test_reference_loads_and_follows_changes(self):
+    source = SerializedSampleModel.get(self.sources[0].key())
+    with self.count_lookups() as get_multi:
+      self.assertEqual(source.reference('reference1').string1, 'value0')
+      self.assertEqual(source.reference('reference1').string1, 'value0')
+      self.assertEqual(get_multi.call_count, 1)
+      source.reference1 = self.targets[1].key()
+      self.assertEqual(source.reference('reference1').string1, 'value1')
+      self.assertEqual(get_multi.call_count, 2)
+
+  def test_unknown_reference_field(self):
+    with self.assertRaises(AttributeError):
+      model.Model.prefetch_references(self.sources, ['string1'])
+    with self.assertRaises(ValueError):
+      SerializedSampleModel.query().keys_only().prefetch('reference1')
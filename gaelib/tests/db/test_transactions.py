@@ -0,0 +1,124 @@
+"""
+    This module defines the testcases for datastore transactions.
+"""
+from google.api_core import exceptions
+from mock import patch
+
+from gaelib import db
+from gaelib.db import cache, context, transactions
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import CachedSampleModel, SampleModel
+
+
+class TransactionTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    transactions.clear_stats()
+    self.sleep_patch = patch.object(transactions, '_sleep')
+    self.sleep = self.sleep_patch.start()
+    self.datastore_client = SampleModel.get_client()
+
+  def tearDown(self):
+    self.sleep_patch.stop()
+    super().tearDown()
+
+  def test_writes_land_on_commit(self):
+    with self.app_for_test.test_request_context():
+      with db.transaction():
+        model = SampleModel(key_str='committed', int1=1)
+        model.put()
+        self.assertEqual(self.get_entity_count('SampleModel'), 0)
+        self.assertNotIn(model.key(), context.get_identity_map())
+        self.assertTrue(model.is_dirty())
+      self.assertEqual(self.get_entity_count('SampleModel'), 1)
+      self.assertIn(model.key(), context.get_identity_map())
+      self.assertFalse(model.is_dirty())
+    self.assertEqual(transactions.stats()['commits'], 1)
+
+  def test_error_rolls_back(self):
+    with self.assertRaises(RuntimeError):
+      with db.transaction():
+        SampleModel(key_str='rolled_back').put()
+        raise RuntimeError('handler failed')
+    self.assertEqual(self.get_entity_count('SampleModel'), 0)
+
+  def test_models_with_their_own_client(self):
+    client = type(self.datastore_client)(
+        project=self.datastore_client.project,
+        namespace=self.datastore_client.namespace)
+    with patch.object(SampleModel, '__client__', client):
+      with self.assertRaises(RuntimeError):
+        with db.transaction(client=SampleModel.get_client()):
+          SampleModel(key_str='rolled_back').put()
+          raise RuntimeError('handler failed')
+      self.assertEqual(self.get_entity_count('SampleModel'), 0)
+
+      # Writes on another client than the transaction's are refused
+      with self.assertRaises(ValueError):
+        with db.transaction():
+          SampleModel(key_str='outside').put()
+      with self.assertRaises(ValueError):
+        with db.transaction():
+          SampleModel(key_str='outside').delete()
+      with db.transaction():
+        result = SampleModel.put_multi([SampleModel(key_str='outside')])[0]
+      self.assertIsInstance(result.error, ValueError)
+    self.assertEqual(self.get_entity_count('SampleModel'), 0)
+
+  def test_reads_bypass_caches(self):
+    model = CachedSampleModel(key_str='cached', string1='value1')
+    model.put()
+    self.assertEqual(len(cache.get_backend()), 1)
+    with patch.object(self.datastore_client, 'get_multi',
+                      wraps=self.datastore_client.get_multi) as get_multi:
+      with db.transaction(read_only=True):
+        self.assertEqual(CachedSampleModel.get(model.key()).string1, 'value1')
+    get_multi.assert_called_once()
+
+  def test_contention_is_retried(self):
+    calls = []
+
+    @db.transactional
+    def increment():
+      calls.append(1)
+      model = SampleModel.get(SampleModel.generate_key('counter'))
+      model.int1 += 1
+      model.put()
+      if len(calls) < 3:
+        raise exceptions.Aborted('too much contention')
+      return model.int1
+
+    SampleModel(key_str='counter', int1=0).put()
+    self.assertEqual(increment(), 1)
+    self.assertEqual(SampleModel(key_str='counter').int1, 1)
+    self.assertEqual(self.sleep.call_count, 2)
+    stats = transactions.stats()
+    self.assertEqual(stats['retries'], 2)
+    self.assertEqual(list(stats['retries_by_name'].values()), [2])
+
+  def test_attempts_are_capped(self):
+    @db.transactional(attempts=2)
+    def always_contended():
+      raise exceptions.Conflict('too much contention')
+
+    with self.assertRaises(exceptions.Conflict):
+      always_contended()
+    self.assertEqual(self.sleep.call_count, 1)
+    self.assertEqual(transactions.stats()['failures'], 1)
+
+  def test_nested_transactions_join(self):
+    with db.transaction() as outer:
+      self.assertEqual(db.run_in_transaction(
+          lambda: transactions.get_current().transaction), outer)
+      SampleModel(key_str='nested').put()
+    self.assertEqual(self.get_entity_count('SampleModel'), 1)
+    self.assertEqual(transactions.stats()['commits'], 1)
+
+  def test_unit_of_work_is_bypassed(self):
+    with db.batched_writes() as work:
+      with db.transaction():
+        SampleModel(key_str='bypassed').put()
+      self.assertEqual(len(work), 0)
+      self.assertEqual(self.get_entity_count('SampleModel'), 1)
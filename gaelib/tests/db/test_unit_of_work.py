@@ -0,0 +1,92 @@
+"""
+    This module defines the testcases for the unit of work.
+"""
+from mock import patch
+
+from gaelib import db
+from gaelib.db import constants, unit_of_work
+from gaelib.tests.base import BaseUnitTestCase
+
+from .model import CachedSampleModel, SampleModel
+
+
+class UnitOfWorkTestCase(BaseUnitTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.datastore_client = SampleModel.get_client()
+
+  def test_writes_are_sent_together(self):
+    with patch.object(self.datastore_client, 'put_multi',
+                      wraps=self.datastore_client.put_multi) as put_multi, \
+            patch.object(self.datastore_client, 'put') as put:
+      with db.batched_writes() as work:
+        for i in range(3):
+          SampleModel(key_str='work{}'.format(i), int1=i).put()
+        self.assertEqual(len(work), 3)
+        self.assertEqual(self.get_entity_count('SampleModel'), 0)
+    put.assert_not_called()
+    self.assertEqual(put_multi.call_count, 1)
+    self.assertEqual(self.get_entity_count('SampleModel'), 3)
+
+  def test_writes_are_deduplicated_by_key(self):
+    with db.batched_writes() as work:
+      first = SampleModel(key_str='dedupe', int1=1)
+      first.put()
+      second = SampleModel(key_str='dedupe', int1=2)
+      second.put()
+      SampleModel(key_str='deleted', int1=3).put()
+      SampleModel(key_str='deleted').delete()
+      self.assertEqual(len(work), 2)
+    self.assertEqual(SampleModel(key_str='dedupe').int1, 2)
+    self.assertFalse(SampleModel(key_str='deleted').retrieved())
+    self.assertFalse(second.is_dirty())
+
+  def test_reads_see_pending_writes(self):
+    CachedSampleModel(key_str='pending', string1='value1').put()
+    with db.batched_writes():
+      model = CachedSampleModel.get(CachedSampleModel.generate_key('pending'))
+      model.string1 = 'value2'
+      model.put()
+      self.assertEqual(CachedSampleModel(key_str='pending').string1, 'value2')
+      model.delete()
+      self.assertIsNone(
+          CachedSampleModel.get(CachedSampleModel.generate_key('pending')))
+    self.assertEqual(self.get_entity_count('CachedSampleModel'), 0)
+
+  def test_explicit_flush(self):
+    with db.batched_writes() as work:
+      SampleModel(key_str='flushed').put()
+      db.flush()
+      self.assertEqual(len(work), 0)
+      self.assertEqual(self.get_entity_count('SampleModel'), 1)
+
+  def test_nested_blocks_flush_once(self):
+    with db.batched_writes() as outer:
+      with db.batched_writes() as inner:
+        SampleModel(key_str='nested').put()
+      self.assertIs(inner, outer)
+      self.assertEqual(self.get_entity_count('SampleModel'), 0)
+    self.assertEqual(self.get_entity_count('SampleModel'), 1)
+    self.assertIsNone(unit_of_work.get_current())
+
+  def test_writes_are_dropped_on_error(self):
+    with self.assertRaises(RuntimeError):
+      with db.batched_writes():
+        SampleModel(key_str='dropped').put()
+        raise RuntimeError('handler failed')
+    self.assertEqual(self.get_entity_count('SampleModel'), 0)
+
+  def test_decorated_view(self):
+    @db.batched_writes()
+    def view():
+      SampleModel(key_str='view1').put()
+      SampleModel(key_str='view2').put()
+      return 'done'
+
+    with patch.object(constants, 'MAX_MUTATIONS_PER_COMMIT', 1), \
+            patch.object(self.datastore_client, 'put_multi',
+                         wraps=self.datastore_client.put_multi) as put_multi:
+      self.assertEqual(view(), 'done')
+    self.assertEqual(put_multi.call_count, 2)
+    self.assertEqual(self.get_entity_count('SampleModel'), 2)
@@ -64,6 +64,15 @@ class SampleController():
     sample_entity.delete()
 
 
+class PagedSampleController(SampleController):
+  """
+      The controller for the Sample Model that pages through entities
+  """
+  @staticmethod
+  def get_entities_page(page_size, cursor=None):
+    return SampleModel.retrieve_page(page_size, start_cursor=cursor)
+
+
 class SampleAPI(BaseAPIHandler):
   controller = SampleController
 
@@ -84,6 +93,10 @@ class SampleAPI5(BaseAPIHandler):
   controller = SampleController
 
 
+class SampleAPI6(BaseAPIHandler):
+  controller = PagedSampleController
+
+
 api_test_urls = Blueprint('test_api', __name__)
 api_test_urls.add_url_rule(
     '/sampleapiwithnocontroller/',
@@ -121,6 +134,12 @@ api_test_urls.add_url_rule(
       'gaelib.tests.views.test_base_view.SampleAPI5', 'sample_api_delete_entity'),
     methods=['DELETE'])
 
+api_test_urls.add_url_rule(
+    '/sampleapigetentitiespage/',
+    view_func=LazyView(
+      'gaelib.tests.views.test_base_view.SampleAPI6', 'sample_api_get_entities_page'),
+    methods=['GET'])
+
 api_test_app = web.startup(parameter_logging=True,
                            client_logging=True)
 api_test_app.register_blueprint(api_test_urls, name=f"gaelib_test_api")
@@ -323,3 +342,53 @@ class BaseAPIHandlerTestCase(BaseAuthenticatedUnitTestCase):
     self.assertTrue(response.is_json)
     self.assertEqual(response.json['error_message'],
                      f"No entity with id {s1.key().id}")
+
+  def test_get_entities_page(self):
+    """
+        Testing paging through entities with a cursor
+    """
+    self.add_user_entity(
+        name='user1', email='a@b.com', uid='user1', client_user=True)
+    for i in range(5):
+      SampleModel(string_field='s{}'.format(i)).put()
+
+    seen = []
+    cursor = ''
+    for _ in range(5):
+      response = self.client.get(
+          f"/sampleapigetentitiespage/?page_size=2&cursor={cursor}",
+          headers=self.auth_headers())
+      self.assertEqual(response.status_code, 200)
+      self.assertLessEqual(len(response.json['entities']), 2)
+      seen.extend(entity['string_field']
+                  for entity in response.json['entities'])
+      if not response.json['more']:
+        break
+      cursor = response.json['cursor']
+    self.assertEqual(sorted(seen), ['s0', 's1', 's2', 's3', 's4'])
+
+  def test_get_entities_page_with_invalid_page_size(self):
+    """
+        Testing paging with a non numeric page size
+    """
+    self.add_user_entity(
+        name='user1', email='a@b.com', uid='user1', client_user=True)
+    response = self.client.get(
+        "/sampleapigetentitiespage/?page_size=abc", headers=self.auth_headers())
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.json['error_message'],
+                     'Page size does not look numeric')
+
+  def test_get_entities_page_with_out_of_range_page_size(self):
+    """
+        Testing paging with a page size outside of the allowed range
+    """
+    self.add_user_entity(
+        name='user1', email='a@b.com', uid='user1', client_user=True)
+    for page_size in ['0', '1000000']:
+      response = self.client.get(
+          f"/sampleapigetentitiespage/?page_size={page_size}",
+          headers=self.auth_headers())
+      self.assertEqual(response.status_code, 400)
+      self.assertEqual(response.json['error_message'],
+                       'Page size must be between 1 and 500')
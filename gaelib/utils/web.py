@@ -2,7 +2,7 @@ import os
 import logging
 
 
-from flask import g, Flask, json, request
+from flask import g, Flask, has_request_context, json, request
 from google.cloud.logging_v2.client import Client
 from google.cloud.logging_v2.handlers import CloudLoggingHandler
 from gaelib.env import (
@@ -16,6 +16,8 @@ from gaelib.env import (
     get_twilio_verification_sid,
     is_dev)
 from gaelib import filters
+from gaelib.db import context as db_context
+from gaelib.db import instrumentation as db_instrumentation
 from gaelib.urls import (auth_urls,
                          verification_urls,
                          dashboard_lib_urls,
@@ -75,6 +77,41 @@ def log_request_info():
     g.app.logger.info('Request json: ' + str(request.json))
 
 
+@app.teardown_request
+def clear_datastore_context(exception=None):
+  """
+      Drops the datastore identity map of the finished request
+  """
+  db_context.clear_identity_map(exception)
+
+
+@app.after_request
+def add_server_timing(response):
+  """
+      Adds the datastore rpc timings of the request as a Server-Timing
+      header, when enabled with startup(server_timing=True)
+  """
+  if app.config.get('DATASTORE_SERVER_TIMING'):
+    stats = db_instrumentation.get_current()
+    if stats:
+      response.headers.add('Server-Timing', stats.server_timing())
+  return response
+
+
+@app.teardown_request
+def log_datastore_rpcs(exception=None):
+  """
+      Logs the datastore rpcs the finished request made
+  """
+  summary = db_instrumentation.finish_request(exception)
+  if summary is None:
+    return
+  if has_request_context():
+    summary['request'] = request.method + ' ' + request.path
+  app.logger.info('Datastore rpcs: ' + json.dumps(summary),
+                  extra={'json_fields': summary})
+
+
 @app.context_processor
 def inject_global_template_vars():
   return dict(app_name=get_app_or_default_prop('APP_NAME'),
@@ -86,9 +123,11 @@ def inject_global_template_vars():
   )
 
 
-def startup(auth=True, blueprint_scope='', parameter_logging=False, client_logging=False, dashboard=True, verification=True):
+def startup(auth=True, blueprint_scope='', parameter_logging=False, client_logging=False, dashboard=True, verification=True, server_timing=False):
   """The startup script to create flask app and check if
       the application is running on local server or production.
+      With server_timing the datastore rpc timings of every request
+      are added to the response as a Server-Timing header.
   """
 
   if is_dev():
@@ -128,4 +167,6 @@ def startup(auth=True, blueprint_scope='', parameter_logging=False, client_loggi
   if client_logging:
     app.register_blueprint(client_logger_urls, name=f"{blueprint_scope}_clientlogger")
 
+  app.config['DATASTORE_SERVER_TIMING'] = server_timing
+
   return app
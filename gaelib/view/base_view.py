@@ -10,6 +10,8 @@ from werkzeug.exceptions import HTTPException
 
 from gaelib.auth.decorators import auth_required
 from gaelib.cron.decorators import cron_validate
+from gaelib.db.constants import QUERY_PAGE_SIZE
+from gaelib.db.model import Model
 from gaelib.tasks.decorators import cron_or_task_validate
 
 
@@ -121,13 +123,32 @@ class BaseAPIHandler(BaseHttpHandler):
       try:
         entity = self.controller.get_entities(int(entity_id))[0]
       except IndexError:
+        entity = None
+      if entity is None:
         error = f"No entity with id {entity_id}"
         response, _, _ = self.json_error(error, 400)
         raise HTTPException(error, response)
       return self.json_response(entity.to_json(), 200)
+    elif hasattr(self.controller, 'get_entities_page'):
+      # Controllers that can page get a cursor to resume from
+      page_size = request.args.get('page_size', '')
+      if page_size and not page_size.isnumeric():
+        error = "Page size does not look numeric"
+        response, _, _ = self.json_error(error, 400)
+        raise HTTPException(error, response)
+      page_size = int(page_size) if page_size else QUERY_PAGE_SIZE
+      if not 1 <= page_size <= QUERY_PAGE_SIZE:
+        error = f"Page size must be between 1 and {QUERY_PAGE_SIZE}"
+        response, _, _ = self.json_error(error, 400)
+        raise HTTPException(error, response)
+      entities, cursor, more = self.controller.get_entities_page(
+          page_size, request.args.get('cursor'))
+      entities = Model.serialize_many(entities)
+      return self.json_response(
+          {'entities': entities, 'cursor': cursor, 'more': more}, 200)
     else:
       entities = self.controller.get_entities()
-      entities = [entity.to_json() for entity in entities]
+      entities = Model.serialize_many(entities)
       return self.json_response({'entities': entities}, 200)
 
   def post(self, entity_id=''):